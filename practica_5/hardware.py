@@ -1,8 +1,14 @@
 #!/usr/bin/env python
 
 from tabulate import tabulate
-from time import sleep
-from threading import Thread, Lock
+from time import sleep, perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, local, current_thread
+from collections import deque
+import asyncio
+import heapq
+import os
+import functools
 import log
 
 ##  Estas son la instrucciones soportadas por nuestro CPU
@@ -18,9 +24,15 @@ class ASM():
     def EXIT(self, times):
         return [INSTRUCTION_EXIT] * times
 
+    ## IO() uses the default device, IO(deviceId) targets a specific one ("IO:Disk")
+    ## and IO(deviceId, argument) passes an argument to the device ("IO:Disk:57")
     @classmethod
-    def IO(self):
-        return INSTRUCTION_IO
+    def IO(self, deviceId = None, argument = None):
+        if deviceId == None:
+            return INSTRUCTION_IO
+        if argument == None:
+            return INSTRUCTION_IO + ":" + deviceId
+        return INSTRUCTION_IO + ":" + deviceId + ":" + str(argument)
 
     @classmethod
     def CPU(self, times):
@@ -32,7 +44,23 @@ class ASM():
 
     @classmethod
     def isIO(self, instruction):
-        return INSTRUCTION_IO == instruction
+        return INSTRUCTION_IO == instruction or instruction.startswith(INSTRUCTION_IO + ":")
+
+    ## returns the device targeted by an IO instruction (None for the default device)
+    @classmethod
+    def deviceOf(self, instruction):
+        if INSTRUCTION_IO == instruction:
+            return None
+        return instruction.split(":")[1]
+
+    ## returns the argument of an IO instruction (None if it has no argument)
+    ## the argument is everything after the device, it may have ":" (ej: a FileIODevice payload)
+    @classmethod
+    def argumentOf(self, instruction):
+        parts = instruction.split(":", 2)
+        if len(parts) < 3:
+            return None
+        return parts[2]
 
 
 ##  Estas son la interrupciones soportadas por nuestro Kernel
@@ -41,14 +69,51 @@ IO_IN_INTERRUPTION_TYPE = "#IO_IN"
 IO_OUT_INTERRUPTION_TYPE = "#IO_OUT"
 NEW_INTERRUPTION_TYPE = "#NEW"
 TIMEOUT_INTERRUPTION_TYPE = "#TIMEOUT"
+DMA_INTERRUPTION_TYPE = "#DMA"
+
+## prioridad de cada interrupcion cuando se difieren (menor = se atiende antes)
+## las del proceso en CPU (timer, #KILL, #IO_IN) > I/O > programas nuevos
+## las del proceso en CPU actuan sobre el runningPCB, asi que van antes que las que pueden expropiarlo
+## (en un tick el CPU levanta a lo sumo una)
+INTERRUPTION_PRIORITIES = {
+    TIMEOUT_INTERRUPTION_TYPE: 0,
+    KILL_INTERRUPTION_TYPE: 0,
+    IO_IN_INTERRUPTION_TYPE: 0,
+    IO_OUT_INTERRUPTION_TYPE: 1,
+    DMA_INTERRUPTION_TYPE: 1,
+    NEW_INTERRUPTION_TYPE: 2,
+}
 
 ## emulates an Interrupt request
+## the handled irqs go back to a free list and IRQ.create reuses them
 class IRQ:
 
+    __slots__ = ('_type', '_parameters')
+
+    _pool = []
+    _poolMaxSize = 1024
+
     def __init__(self, type, parameters = None):
         self._type = type
         self._parameters = parameters
 
+    @classmethod
+    def create(cls, type, parameters = None):
+        try:
+            irq = cls._pool.pop()
+        except IndexError:
+            return cls(type, parameters)
+        irq._type = type
+        irq._parameters = parameters
+        return irq
+
+    ## the irq must not be used after releasing it
+    @classmethod
+    def release(cls, irq):
+        irq._parameters = None
+        if len(cls._pool) < cls._poolMaxSize:
+            cls._pool.append(irq)
+
     @property
     def parameters(self):
         return self._parameters
@@ -58,33 +123,234 @@ class IRQ:
         return self._type
 
 
+## collects the seconds spent in named sections, per call stack and per thread
+## (each thread keeps its own stack and counters, so start/stop never take a lock)
+class Profiler():
+
+    def __init__(self):
+        self._local = local()
+        self._threadStats = []
+
+    ## [path, start, seconds spent in the children] of the sections open in this thread
+    def __frames(self):
+        try:
+            return self._local.frames
+        except AttributeError:
+            self._local.frames = [[current_thread().name, 0.0, 0.0]]
+            self._local.stats = dict()
+            self._threadStats.append(self._local.stats)
+            return self._local.frames
+
+    def start(self, name):
+        frames = self.__frames()
+        frames.append([frames[-1][0] + ";" + name, perf_counter(), 0.0])
+
+    def stop(self):
+        now = perf_counter()
+        frames = self._local.frames
+        path, start, children = frames.pop()
+        elapsed = now - start
+        frames[-1][2] += elapsed
+        stats = self._local.stats.get(path)
+        if stats == None:
+            stats = [0, 0.0, 0.0]
+            self._local.stats[path] = stats
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += elapsed - children
+
+    ## path -> [calls, total seconds, self seconds] of all the threads
+    def stats(self):
+        merged = dict()
+        for threadStats in list(self._threadStats):
+            for path, (calls, total, own) in list(threadStats.items()):
+                stats = merged.setdefault(path, [0, 0.0, 0.0])
+                stats[0] += calls
+                stats[1] += total
+                stats[2] += own
+        return merged
+
+    ## "thread;section;subsection microseconds" lines, as flamegraph.pl and speedscope read them
+    def collapsedStacks(self):
+        lines = []
+        for path, (calls, total, own) in sorted(self.stats().items()):
+            microseconds = int(own * 1000000)
+            if microseconds > 0:
+                lines.append("{path} {us}".format(path=path, us=microseconds))
+        return lines
+
+    def writeCollapsedStacks(self, path):
+        with open(path, "w") as stacksFile:
+            for line in self.collapsedStacks():
+                stacksFile.write(line + "\n")
+
+    ## section -> [calls, total seconds, self seconds], adding up the stacks it appears in
+    def sectionStats(self):
+        sections = dict()
+        for path, (calls, total, own) in self.stats().items():
+            stats = sections.setdefault(path.rsplit(";", 1)[-1], [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += total
+            stats[2] += own
+        return sections
+
+    def summary(self):
+        sections = self.sectionStats()
+        profiled = sum(own for calls, total, own in sections.values())
+        rows = []
+        for name, (calls, total, own) in sorted(sections.items(), key=lambda item: -item[1][2]):
+            share = 100.0 * own / profiled if profiled > 0 else 0.0
+            rows.append([name, calls, "{:.6f}".format(total), "{:.6f}".format(own),
+                         "{:.4f}".format(1000.0 * total / calls), "{:.1f}".format(share)])
+        return tabulate(rows, headers=["section", "calls", "total s", "self s", "average ms", "self %"], tablefmt='psql')
+
+    def __repr__(self):
+        return self.summary()
+
+
+## times the decorated method as the section "name" when HARDWARE has a profiler
+def profiled(name):
+    def decorator(method):
+        @functools.wraps(method)
+        def profiledMethod(*args, **kwargs):
+            profiler = HARDWARE.profiler
+            if profiler == None:
+                return method(*args, **kwargs)
+            profiler.start(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                profiler.stop()
+        return profiledMethod
+    return decorator
+
+
 ## emulates the Interrupt Vector Table
+## deferred = True: irqs are queued and run by priority at the end of each tick
 class InterruptVector():
 
-    def __init__(self):
+    def __init__(self, deferred = False):
         self._handlers = dict()
         self.lock = Lock()
+        self._deferred = deferred
+        ## deque.append is thread safe, so raising an irq never waits for a lock
+        self._incoming = deque()
+        self._pending = []
+        self._pendingCount = 0
+        ## interruptionType -> [executions, seconds]
+        self._handlerTimes = dict()
+        self._profiler = None
+
+    @property
+    def deferred(self):
+        return self._deferred
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
 
     def register(self, interruptionType, interruptionHandler):
         self._handlers[interruptionType] = interruptionHandler
 
     def handle(self, irq):
+        if self._deferred:
+            self._incoming.append(irq)
+        else:
+            self.lock.acquire()
+            try:
+                self.__execute(irq)
+            finally:
+                self.lock.release()
+
+    ## runs all the pending irqs by priority (the ones raised meanwhile too)
+    def dispatchPending(self, tickNbr):
+        while (len(self._incoming) > 0) or (len(self._pending) > 0):
+            while len(self._incoming) > 0:
+                irq = self._incoming.popleft()
+                heapq.heappush(self._pending, (INTERRUPTION_PRIORITIES.get(irq.type, 2), self._pendingCount, irq))
+                self._pendingCount += 1
+            self.__execute(heapq.heappop(self._pending)[2])
+
+    def __execute(self, irq):
         log.logger.info("Handling {type} irq with parameters = {parameters}".format(type=irq.type, parameters=irq.parameters ))
-        self.lock.acquire()
-        self._handlers[irq.type].execute(irq)
-        self.lock.release()
+        handler = self._handlers[irq.type]
+        profiler = self._profiler
+        if profiler != None:
+            profiler.start(handler.__class__.__name__ + ".execute")
+        start = perf_counter()
+        try:
+            handler.execute(irq)
+        finally:
+            ## the stack of the profiler stays balanced even if the handler fails
+            if profiler != None:
+                profiler.stop()
+        times = self._handlerTimes.get(irq.type)
+        if times == None:
+            times = [0, 0.0]
+            self._handlerTimes[irq.type] = times
+        times[0] += 1
+        times[1] += perf_counter() - start
+        IRQ.release(irq)
+
+    @property
+    def pendingCount(self):
+        return len(self._incoming) + len(self._pending)
+
+    ## the irqs raised and not handled yet (only with deferred interrupts, between two ticks)
+    def getState(self):
+        if len(self._pending) > 0:
+            raise Exception("Can't checkpoint while the irqs are being dispatched")
+        incoming = []
+        for irq in list(self._incoming):
+            if irq.type == DMA_INTERRUPTION_TYPE:
+                raise Exception("Can't checkpoint with a #DMA irq pending")
+            incoming.append((irq.type, irq.parameters))
+        return {'incoming': incoming}
+
+    def setState(self, state):
+        self._incoming = deque([IRQ.create(type, parameters) for type, parameters in state['incoming']])
+
+    ## interruptionType -> (executions, total seconds, average seconds)
+    def handlerStats(self):
+        stats = dict()
+        ## copied first: another thread (e.g. a metrics scrape) may be reading while an irq is handled
+        for interruptionType, times in list(self._handlerTimes.items()):
+            stats[interruptionType] = (times[0], times[1], times[1] / times[0])
+        return stats
+
+    def handlerReport(self):
+        rows = [[interruptionType, count, "{:.6f}".format(total), "{:.6f}".format(average)] for interruptionType, (count, total, average) in sorted(self.handlerStats().items())]
+        return tabulate(rows, headers=["irq", "count", "total s", "average s"], tablefmt='psql')
 
 
 ## emulates the Internal Clock
 class Clock():
 
-    def __init__(self):
+    def __init__(self, tickTime = 1):
         self._subscribers = []
+        self._tickEndSubscribers = []
         self._running = False
+        self._currentTick = 0
+        ## the clock starts counting from here (the tick after the last one notified)
+        self._nextTick = 0
+        ## while a tick is notified: the subscriber being ticked (len(subscribers): the deferred irqs
+        ## and the end of the tick), None between ticks
+        self._phase = None
+        self._tickTime = tickTime
+        self._interruptDispatcher = None
+        self._profiler = None
 
     def addSubscriber(self, subscriber):
         self._subscribers.append(subscriber)
 
+    ## told (tickEnded(tickNbr)) when the tick is over: every subscriber ticked and the deferred irqs ran
+    def addTickEndSubscriber(self, subscriber):
+        self._tickEndSubscribers.append(subscriber)
+
     def stop(self):
         self._running = False
 
@@ -95,18 +361,100 @@ class Clock():
         t.start()
 
     def __start(self):
-        tickNbr = 0
+        tickNbr = self._nextTick
         while (self._running):
             self.tick(tickNbr)
             tickNbr += 1
 
+    @property
+    def currentTick(self):
+        return self._currentTick
+
+    @property
+    def tickTime(self):
+        return self._tickTime
+
+    @tickTime.setter
+    def tickTime(self, tickTime):
+        self._tickTime = tickTime
+
+    ## the dispatcher runs the deferred irqs after all the subscribers ticked
+    @property
+    def interruptDispatcher(self):
+        return self._interruptDispatcher
+
+    @interruptDispatcher.setter
+    def interruptDispatcher(self, interruptDispatcher):
+        self._interruptDispatcher = interruptDispatcher
+
+    ## times the tick of each subscriber
+    @property
+    def profiler(self):
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
+
+    @property
+    def isAsync(self):
+        return False
+
+    @property
+    def isRunning(self):
+        return self._running
+
     def tick(self, tickNbr):
+        self.notify(tickNbr)
+        ## wait tickTime seconds (1 by default) and keep looping
+        sleep(self._tickTime)
+
+    ## beforePhase(tickNbr, phase), if given, is called before each subscriber ticks and before
+    ## the deferred irqs run (ej: the Replayer injects there what was recorded at that point)
+    def notify(self, tickNbr, beforePhase = None):
+        self._currentTick = tickNbr
+        self._nextTick = tickNbr + 1
         log.logger.info("        --------------- tick: {tickNbr} ---------------".format(tickNbr = tickNbr))
         ## notify all subscriber that a new clock cycle has started
-        for subscriber in self._subscribers:
-            subscriber.tick(tickNbr)
-        ## wait 1 second and keep looping
-        sleep(1)
+        profiler = self._profiler
+        for phase, subscriber in enumerate(self._subscribers):
+            self._phase = phase
+            if beforePhase != None:
+                beforePhase(tickNbr, phase)
+            if profiler == None:
+                subscriber.tick(tickNbr)
+            else:
+                profiler.start(subscriber.__class__.__name__ + ".tick")
+                try:
+                    subscriber.tick(tickNbr)
+                finally:
+                    profiler.stop()
+        self._phase = len(self._subscribers)
+        if beforePhase != None:
+            beforePhase(tickNbr, self._phase)
+        if self._interruptDispatcher != None:
+            self._interruptDispatcher.dispatchPending(tickNbr)
+        for subscriber in self._tickEndSubscribers:
+            subscriber.tickEnded(tickNbr)
+        self._phase = None
+
+    ## the tick the next notify will be (the first one of a restarted clock)
+    @property
+    def nextTick(self):
+        return self._nextTick
+
+    ## None between ticks, see _phase
+    @property
+    def phase(self):
+        return self._phase
+
+    ## a restored clock goes on from the tick after the checkpoint
+    def getState(self):
+        return {'currentTick': self._currentTick, 'nextTick': self._nextTick}
+
+    def setState(self, state):
+        self._currentTick = state['currentTick']
+        self._nextTick = state['nextTick']
 
     def do_ticks(self, times):
         log.logger.info("---- :::: CLOCK do_ticks: {times} ::: -----".format(times=times))
@@ -114,23 +462,164 @@ class Clock():
             self.tick(tickNbr)
 
 
+## emulates the Internal Clock as a coroutine on an asyncio event loop (no threads)
+class AsyncClock(Clock):
+
+    def __init__(self, tickTime = 1):
+        super(AsyncClock, self).__init__(tickTime)
+        ## futures waiting for a tick: (tick, order, future)
+        self._waiters = []
+        self._waitersCount = 0
+        self._task = None
+        self._loop = None
+        self._stopped = False
+
+    @property
+    def isAsync(self):
+        return True
+
+    @property
+    def loop(self):
+        return self._loop
+
+    ## must be called with the event loop running
+    def start(self):
+        log.logger.info("---- :::: START ASYNC CLOCK  ::: -----")
+        self._running = True
+        self._stopped = False
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self.run())
+        return self._task
+
+    def stop(self):
+        super(AsyncClock, self).stop()
+        self._stopped = True
+        ## the ones waiting for this tick are woken up, nobody will resolve the rest
+        self.__wakeUpWaiters(self._currentTick)
+        for waiter in self._waiters:
+            waiter[2].cancel()
+        self._waiters = []
+
+    async def run(self):
+        tickNbr = self._nextTick
+        while (self._running):
+            self.notify(tickNbr)
+            self.__wakeUpWaiters(tickNbr)
+            tickNbr += 1
+            await asyncio.sleep(self._tickTime)
+
+    ## awaitable that is resolved "ticks" ticks from now (cancelled if the clock is stopped)
+    def ticks(self, ticks):
+        future = asyncio.get_running_loop().create_future()
+        if self._stopped:
+            future.cancel()
+            return future
+        heapq.heappush(self._waiters, (self._currentTick + ticks, self._waitersCount, future))
+        self._waitersCount += 1
+        return future
+
+    def __wakeUpWaiters(self, tickNbr):
+        while (len(self._waiters) > 0) and (self._waiters[0][0] <= tickNbr):
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(tickNbr)
+
+
 ## emulates the main memory (RAM)
 class Memory():
 
     def __init__(self, size):
         self._cells = [''] * size
+        ## dirty tracking for incremental dumps (off until setIncrementalDump)
+        self._regionSize = None
+        self._dirtyFlags = None
+        self._dirtyRegions = []
+        self._fullDumpEvery = None
+        self._dumps = 0
 
     def put(self, addr, value):
         self._cells[addr] = value
+        if self._dirtyFlags is not None:
+            self.__markDirty(addr, addr + 1)
 
     def get(self, addr):
         return self._cells[addr]
 
+    ## writes a block of consecutive cells starting at addr
+    def putBlock(self, addr, values):
+        if (addr < 0) or (addr + len(values) > len(self._cells)):
+            raise Exception("Invalid block, {addr}..{end} is outside memory".format(addr=addr, end=addr + len(values) - 1))
+        self._cells[addr:addr+len(values)] = values
+        if self._dirtyFlags is not None:
+            self.__markDirty(addr, addr + len(values))
+
+    ## reads a block of consecutive cells starting at addr
+    def getBlock(self, addr, length):
+        if (addr < 0) or (addr + length > len(self._cells)):
+            raise Exception("Invalid block, {addr}..{end} is outside memory".format(addr=addr, end=addr + length - 1))
+        return self._cells[addr:addr+length]
+
     def memorySize(self):
         return len(self._cells)
 
+    def getState(self):
+        return {'cells': list(self._cells)}
+
+    def setState(self, state):
+        if len(state['cells']) != len(self._cells):
+            raise Exception("The checkpoint has {size} memory cells, this memory has {cells}".format(size=len(state['cells']), cells=len(self._cells)))
+        self._cells[:] = state['cells']
+        ## the next dump shows the restored memory whole
+        self._dumps = 0
+
+    ## from now on dump() only shows the regions of "regionSize" cells written since the previous dump,
+    ## the first dump and then every "fullDumpEvery" dumps show the whole memory (None: only the first one)
+    def setIncrementalDump(self, fullDumpEvery = None, regionSize = 16):
+        self._regionSize = regionSize
+        self._dirtyFlags = bytearray((len(self._cells) + regionSize - 1) // regionSize)
+        self._dirtyRegions = []
+        self._fullDumpEvery = fullDumpEvery
+        self._dumps = 0
+
+    ## (first address, last address + 1) of the regions written since the last dump
+    def dirtyRegions(self):
+        ranges = []
+        for region in sorted(self._dirtyRegions):
+            start = region * self._regionSize
+            end = min(start + self._regionSize, len(self._cells))
+            if len(ranges) > 0 and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    ## the whole memory, or only what changed since the last dump if the incremental dump is on
+    def dump(self):
+        if self._dirtyFlags is None:
+            return repr(self)
+        full = self._dumps == 0 or (self._fullDumpEvery is not None and self._dumps % self._fullDumpEvery == 0)
+        self._dumps += 1
+        ranges = self.dirtyRegions()
+        for region in self._dirtyRegions:
+            self._dirtyFlags[region] = 0
+        self._dirtyRegions = []
+        if full:
+            return repr(self)
+        if len(ranges) == 0:
+            return "memory unchanged since the last dump"
+        rows = []
+        for start, end in ranges:
+            rows.extend(zip(range(start, end), self._cells[start:end]))
+        return "memory changes since the last dump:\n" + tabulate(rows, tablefmt='psql', coltypes=[int, str])
+
+    def __markDirty(self, start, end):
+        for region in range(start // self._regionSize, (end - 1) // self._regionSize + 1):
+            if not self._dirtyFlags[region]:
+                self._dirtyFlags[region] = 1
+                self._dirtyRegions.append(region)
+
     def __repr__(self):
-        return tabulate(enumerate(self._cells), tablefmt='psql')
+        return tabulate(enumerate(self._cells), tablefmt='psql', coltypes=[int, str])
         ## return "Memoria = {mem}".format(mem=self._cells)
 
 ## emulates the Memory Management Unit (MMU)
@@ -141,6 +630,7 @@ class MMU():
         self._frameSize = 0
         self._limit = 999
         self._tlb = dict()
+        self._pageFaults = 0
 
     @property
     def limit(self):
@@ -158,9 +648,22 @@ class MMU():
     def frameSize(self, frameSize):
         self._frameSize = frameSize
 
+    @property
+    def pageFaults(self):
+        return self._pageFaults
+
     def resetTLB(self):
         self._tlb = dict()
 
+    def getState(self):
+        return {'frameSize': self._frameSize, 'limit': self._limit, 'tlb': dict(self._tlb), 'pageFaults': self._pageFaults}
+
+    def setState(self, state):
+        self._frameSize = state['frameSize']
+        self._limit = state['limit']
+        self._tlb = dict(state['tlb'])
+        self._pageFaults = state['pageFaults']
+
     def setPageFrame(self, pageId, frameId):
         self._tlb[pageId] = frameId
 
@@ -176,6 +679,7 @@ class MMU():
         try:
             frameId = self._tlb[pageId]
         except:
+            self._pageFaults += 1
             raise Exception("\n*\n* ERROR \n*\n Error en el MMU\nNo se cargo la pagina  {pageId}".format(pageId = str(pageId)))
         #
         ##calculamos la direccion fisica resultante
@@ -213,10 +717,14 @@ class Cpu():
 
     def _execute(self):
         if ASM.isEXIT(self._ir):
-            killIRQ = IRQ(KILL_INTERRUPTION_TYPE)
+            killIRQ = IRQ.create(KILL_INTERRUPTION_TYPE)
             self._interruptVector.handle(killIRQ)
         elif ASM.isIO(self._ir):
-            ioInIRQ = IRQ(IO_IN_INTERRUPTION_TYPE, self._ir)
+            deviceId = ASM.deviceOf(self._ir)
+            if deviceId != None:
+                ## like a fault of the MMU: the instruction is invalid, the kernel is never called
+                HARDWARE.getIODevice(deviceId).validate(self._ir)
+            ioInIRQ = IRQ.create(IO_IN_INTERRUPTION_TYPE, self._ir)
             self._interruptVector.handle(ioInIRQ)
         else:
             log.logger.info("cpu - Exec: {instr}, PC={pc}".format(instr=self._ir, pc=self._pc))
@@ -225,6 +733,13 @@ class Cpu():
     def isBusy(self):
         return self._pc > -1
 
+    def getState(self):
+        return {'pc': self._pc, 'ir': self._ir}
+
+    def setState(self, state):
+        self._pc = state['pc']
+        self._ir = state['ir']
+
     @property
     def pc(self):
         return self._pc
@@ -237,44 +752,220 @@ class Cpu():
         return "CPU(PC={pc})".format(pc=self._pc)
 
 ## emulates an Input/output device of the Hardware
+## each channel runs one operation, a device has 1 channel unless said otherwise
 class AbstractIODevice():
 
-    def __init__(self, deviceId, deviceTime):
+    def __init__(self, deviceId, deviceTime, channels = 1):
         self._deviceId = deviceId
         self._deviceTime = deviceTime
-        self._busy = False
+        self._channelsCount = channels
+        ## channel -> {'operation', 'ticksCount', 'deviceTime', 'completion'} for the busy channels
+        self._activeChannels = dict()
+        self._freeChannels = list(range(channels - 1, -1, -1))
+        self._completedOperations = 0
+        self._asyncClock = None
+        ## interrupt coalescing: completions waiting to be delivered as (channel, tick)
+        self._coalesceWindow = 0
+        self._coalesceCount = None
+        self._pendingCompletions = []
+        self._raisedIRQs = 0
+        self._addedLatency = 0
+        ## utilization: ticks with at least one operation running
+        self._busyTicks = 0
+        self._busySince = None
+
+    ## with an async clock the device doesn't count ticks, it awaits its completion
+    def attachClock(self, asyncClock):
+        self._asyncClock = asyncClock
+
+    ## awaitable for the operation running in the channel (only with the asyncio backend)
+    def completion(self, channel = 0):
+        return self._activeChannels[channel]['completion']
 
     @property
     def deviceId(self):
         return self._deviceId
 
+    @property
+    def channels(self):
+        return self._channelsCount
+
+    @property
+    def activeChannels(self):
+        return len(self._activeChannels)
+
+    @property
+    def completedOperations(self):
+        return self._completedOperations
+
+    @property
+    def busyTicks(self):
+        if self._busySince == None:
+            return self._busyTicks
+        return self._busyTicks + HARDWARE.clock.currentTick - self._busySince
+
+    @property
+    def idleTicks(self):
+        return HARDWARE.clock.currentTick + 1 - self.busyTicks
+
+    @property
+    def utilization(self):
+        return self.busyTicks / (HARDWARE.clock.currentTick + 1)
+
+    ## completions are delivered together in one #IO_OUT when the oldest one waited
+    ## "window" ticks or when "count" completions are pending (window 0 = no coalescing)
+    def setCoalescing(self, window, count = None):
+        self._coalesceWindow = window
+        self._coalesceCount = count
+
+    @property
+    def raisedIRQs(self):
+        return self._raisedIRQs
+
+    @property
+    def interruptsSaved(self):
+        return self._completedOperations - len(self._pendingCompletions) - self._raisedIRQs
+
+    ## average ticks a completion waited to be delivered because of the coalescing
+    @property
+    def averageAddedLatency(self):
+        delivered = self._completedOperations - len(self._pendingCompletions)
+        if delivered == 0:
+            return 0.0
+        return self._addedLatency / delivered
+
+    ## busy = there is no free channel
     @property
     def is_busy(self):
-        return self._busy
+        return len(self._freeChannels) == 0
 
     @property
     def is_idle(self):
-        return not self._busy
+        return len(self._freeChannels) > 0
+
+    ## devices without a head are always at position 0
+    @property
+    def headPosition(self):
+        return 0
+
+    def positionOf(self, operation):
+        return 0
 
-    ## executes an I/O instruction
-    def execute(self, operation):
-        if (self._busy):
+    ## raises if the device can't execute the operation
+    def validate(self, operation):
+        pass
+
+    ## ticks the device needs to execute the operation
+    def serviceTimeOf(self, operation):
+        return self._deviceTime
+
+    ## free channels, in the order execute() takes them
+    @property
+    def freeChannels(self):
+        return list(reversed(self._freeChannels))
+
+    ## executes an I/O instruction in a free channel and returns the channel used
+    ## (channel = None takes any free one)
+    def execute(self, operation, channel = None):
+        if (self.is_busy):
             raise Exception("Device {id} is busy, can't  execute operation: {op}".format(id = self.deviceId, op = operation))
+        state = {'operation': operation, 'ticksCount': 0, 'deviceTime': self.serviceTimeOf(operation), 'completion': None}
+        channel = self.occupyChannel(state, channel)
+        if (self._asyncClock != None):
+            state['completion'] = self._asyncClock.ticks(state['deviceTime'] + 1)
+            state['completion'].add_done_callback(lambda future: self.__completed(future, channel))
+        return channel
+
+    ## takes a free channel for the operation and returns it
+    def occupyChannel(self, state, channel = None):
+        if channel == None:
+            channel = self._freeChannels.pop()
+        elif channel in self._freeChannels:
+            self._freeChannels.remove(channel)
         else:
-            self._busy = True
-            self._ticksCount = 0
-            self._operation = operation
+            raise Exception("Channel {channel} of device {id} is not free".format(channel=channel, id=self.deviceId))
+        if len(self._activeChannels) == 0:
+            self._busySince = HARDWARE.clock.currentTick
+        self._activeChannels[channel] = state
+        return channel
+
+    def __completed(self, future, channel):
+        if not future.cancelled():
+            self.finish(channel)
+
+    def finish(self, channel = 0):
+        ## operation execution has finished
+        ## the channel stays taken until its completion is delivered
+        del self._activeChannels[channel]
+        if len(self._activeChannels) == 0:
+            self._busyTicks += HARDWARE.clock.currentTick - self._busySince
+            self._busySince = None
+        self._completedOperations += 1
+        self._pendingCompletions.append((channel, HARDWARE.clock.currentTick))
+        if (self._coalesceWindow == 0) or (self._coalesceCount != None and len(self._pendingCompletions) >= self._coalesceCount):
+            self.__deliver()
+        elif (self._asyncClock != None) and (len(self._pendingCompletions) == 1):
+            ## with the async clock nobody ticks the device, so we wait for the window
+            self._asyncClock.ticks(self._coalesceWindow).add_done_callback(lambda future: self.deliverIfDue(HARDWARE.clock.currentTick))
+
+    def deliverIfDue(self, tickNbr):
+        if (len(self._pendingCompletions) > 0) and (tickNbr - self._pendingCompletions[0][1] >= self._coalesceWindow):
+            self.__deliver()
+
+    ## raises one #IO_OUT with the channels of all the pending completions
+    def __deliver(self):
+        now = HARDWARE.clock.currentTick
+        channels = []
+        for channel, tickNbr in self._pendingCompletions:
+            channels.append(channel)
+            self._freeChannels.append(channel)
+            self._addedLatency += now - tickNbr
+        self._pendingCompletions = []
+        self._raisedIRQs += 1
+        ioOutIRQ = IRQ.create(IO_OUT_INTERRUPTION_TYPE, {'deviceId': self._deviceId, 'channels': channels})
+        HARDWARE.interruptVector.handle(ioOutIRQ)
+
+    ## called when the hardware is switched off (devices that hold host resources release them)
+    def shutdown(self):
+        pass
+
+    ## the operations running and the completions not delivered yet, with the statistics
+    def getState(self):
+        if (self._asyncClock != None):
+            raise Exception("Device {id} can't be checkpointed with the asyncio backend".format(id=self._deviceId))
+        channels = dict()
+        for channel, state in self._activeChannels.items():
+            channels[channel] = {'operation': state['operation'], 'ticksCount': state['ticksCount'], 'deviceTime': state['deviceTime']}
+        return {'channels': self._channelsCount, 'activeChannels': channels, 'freeChannels': list(self._freeChannels),
+                'pendingCompletions': list(self._pendingCompletions), 'completedOperations': self._completedOperations,
+                'raisedIRQs': self._raisedIRQs, 'addedLatency': self._addedLatency, 'busyTicks': self._busyTicks,
+                'busySince': self._busySince, 'coalesceWindow': self._coalesceWindow, 'coalesceCount': self._coalesceCount}
+
+    def setState(self, state):
+        if state['channels'] != self._channelsCount:
+            raise Exception("Device {id} has {channels} channels, the checkpoint has {saved}".format(id=self._deviceId, channels=self._channelsCount, saved=state['channels']))
+        self._activeChannels = dict()
+        for channel, channelState in state['activeChannels'].items():
+            self._activeChannels[channel] = {'operation': channelState['operation'], 'ticksCount': channelState['ticksCount'], 'deviceTime': channelState['deviceTime'], 'completion': None}
+        self._freeChannels = list(state['freeChannels'])
+        self._pendingCompletions = list(state['pendingCompletions'])
+        self._completedOperations = state['completedOperations']
+        self._raisedIRQs = state['raisedIRQs']
+        self._addedLatency = state['addedLatency']
+        self._busyTicks = state['busyTicks']
+        self._busySince = state['busySince']
+        self._coalesceWindow = state['coalesceWindow']
+        self._coalesceCount = state['coalesceCount']
 
     def tick(self, tickNbr):
-        if (self._busy):
-            self._ticksCount += 1
-            if (self._ticksCount > self._deviceTime):
-                ## operation execution has finished
-                self._busy = False
-                ioOutIRQ = IRQ(IO_OUT_INTERRUPTION_TYPE, self._deviceId)
-                HARDWARE.interruptVector.handle(ioOutIRQ)
+        ## list(): finish() modifies the active channels
+        for channel, state in list(self._activeChannels.items()):
+            state['ticksCount'] += 1
+            if (state['ticksCount'] > state['deviceTime']):
+                self.finish(channel)
             else:
-                log.logger.info("device {deviceId} - Busy: {ticksCount} of {deviceTime}".format(deviceId = self.deviceId, ticksCount = self._ticksCount, deviceTime = self._deviceTime))
+                log.logger.info("device {deviceId} - Busy: {ticksCount} of {deviceTime}".format(deviceId = self.deviceId, ticksCount = state['ticksCount'], deviceTime = state['deviceTime']))
+        self.deliverIfDue(tickNbr)
 
 
 class PrinterIODevice(AbstractIODevice):
@@ -282,6 +973,281 @@ class PrinterIODevice(AbstractIODevice):
         super(PrinterIODevice, self).__init__("Printer", 3)
 
 
+## emulates a disk: the service time depends on how far the head has to move
+## operations are ASM.IO("Disk", track)
+class DiskIODevice(AbstractIODevice):
+
+    def __init__(self, deviceId = "Disk", tracks = 100, tracksPerTick = 10, transferTime = 1):
+        super(DiskIODevice, self).__init__(deviceId, transferTime)
+        self._tracks = tracks
+        self._tracksPerTick = tracksPerTick
+        self._transferTime = transferTime
+        self._head = 0
+        self._seekDistance = 0
+        self._operations = 0
+
+    @property
+    def headPosition(self):
+        return self._head
+
+    @property
+    def tracks(self):
+        return self._tracks
+
+    ## without a track the operation is done wherever the head is
+    def positionOf(self, operation):
+        argument = ASM.argumentOf(operation)
+        if argument == None or argument == "":
+            return self._head
+        return int(argument) % self._tracks
+
+    def validate(self, operation):
+        argument = ASM.argumentOf(operation)
+        if argument == None or argument == "":
+            return
+        try:
+            int(argument)
+        except ValueError:
+            raise Exception("Invalid track for {id}: {track}".format(id=self.deviceId, track=argument))
+
+    def serviceTimeOf(self, operation):
+        distance = abs(self.positionOf(operation) - self._head)
+        ## seek (moving the head) + transfer
+        return self._transferTime + -(-distance // self._tracksPerTick)
+
+    def execute(self, operation, channel = None):
+        track = self.positionOf(operation)
+        channel = super(DiskIODevice, self).execute(operation, channel)
+        self._seekDistance += abs(track - self._head)
+        self._head = track
+        self._operations += 1
+        return channel
+
+    def getState(self):
+        state = super(DiskIODevice, self).getState()
+        state['head'] = self._head
+        state['seekDistance'] = self._seekDistance
+        state['operations'] = self._operations
+        return state
+
+    def setState(self, state):
+        super(DiskIODevice, self).setState(state)
+        self._head = state['head']
+        self._seekDistance = state['seekDistance']
+        self._operations = state['operations']
+
+    @property
+    def totalSeekDistance(self):
+        return self._seekDistance
+
+    @property
+    def averageSeekDistance(self):
+        if self._operations == 0:
+            return 0.0
+        return self._seekDistance / self._operations
+
+    def __repr__(self):
+        return "Disk {id} head: {head} operations: {ops} average seek: {avg:.2f}".format(id=self._deviceId, head=self._head, ops=self._operations, avg=self.averageSeekDistance)
+
+
+## emulates a device with several independent channels (ej: SSD or NIC queues)
+## ASM.IO("SSD", size) takes size * deviceTime ticks, so completions can arrive out of order
+class MultiChannelIODevice(AbstractIODevice):
+
+    def __init__(self, deviceId, deviceTime, channels):
+        super(MultiChannelIODevice, self).__init__(deviceId, deviceTime, channels)
+
+    def serviceTimeOf(self, operation):
+        argument = ASM.argumentOf(operation)
+        if argument == None:
+            return self._deviceTime
+        return self._deviceTime * int(argument)
+
+    def __repr__(self):
+        return "MultiChannelIODevice {id} busy channels: {busy} of {channels} completed: {completed}".format(id=self._deviceId, busy=self.activeChannels, channels=self._channelsCount, completed=self._completedOperations)
+
+
+## device that really writes the payload of each operation to a local file
+## the writes are done by a bounded thread pool (one worker per channel) and the
+## operation finishes (#IO_OUT) when the host write finishes
+## fsyncPolicy: "none" (python buffer), "flush" (os buffer) or "fsync" (disk)
+class FileIODevice(AbstractIODevice):
+
+    def __init__(self, deviceId, path, workers = 2, batchSize = 1, fsyncPolicy = "none"):
+        super(FileIODevice, self).__init__(deviceId, 0, workers)
+        if fsyncPolicy not in ("none", "flush", "fsync"):
+            raise Exception("Invalid fsync policy: {policy}".format(policy=fsyncPolicy))
+        self._path = path
+        self._batchSize = batchSize
+        self._fsyncPolicy = fsyncPolicy
+        self._file = open(path, "a")
+        self._fileLock = Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        ## operations waiting to be sent to the pool: (channel, line)
+        self._batch = []
+        ## channels whose host write finished (written by the pool threads)
+        self._hostCompleted = deque()
+        self._hostWrites = 0
+        self._hostTime = 0.0
+
+    @property
+    def path(self):
+        return self._path
+
+    ## average seconds the host took per operation (to calibrate the simulated devices)
+    @property
+    def averageHostLatency(self):
+        if self._hostWrites == 0:
+            return 0.0
+        return self._hostTime / self._hostWrites
+
+    def execute(self, operation, channel = None):
+        if (self.is_busy):
+            raise Exception("Device {id} is busy, can't  execute operation: {op}".format(id = self.deviceId, op = operation))
+        channel = self.occupyChannel({'operation': operation, 'ticksCount': 0, 'deviceTime': None, 'completion': None}, channel)
+        payload = ASM.argumentOf(operation)
+        if payload == None:
+            payload = operation
+        self._batch.append((channel, "{tick} {payload}\n".format(tick=HARDWARE.clock.currentTick, payload=payload)))
+        ## with the async clock nobody ticks the device, so there is no batching
+        if (len(self._batch) >= self._batchSize) or (self._asyncClock != None):
+            self.__submitBatch()
+        return channel
+
+    def __submitBatch(self):
+        batch = self._batch
+        self._batch = []
+        self._pool.submit(self.__write, batch)
+
+    ## runs in a pool thread
+    def __write(self, batch):
+        start = perf_counter()
+        with self._fileLock:
+            self._file.write("".join([line for channel, line in batch]))
+            if self._fsyncPolicy != "none":
+                self._file.flush()
+            if self._fsyncPolicy == "fsync":
+                os.fsync(self._file.fileno())
+            self._hostWrites += len(batch)
+            self._hostTime += perf_counter() - start
+        for channel, line in batch:
+            if (self._asyncClock != None):
+                self._asyncClock.loop.call_soon_threadsafe(self.finish, channel)
+            else:
+                self._hostCompleted.append(channel)
+
+    def tick(self, tickNbr):
+        ## a batch never waits more than one tick
+        if len(self._batch) > 0:
+            self.__submitBatch()
+        while len(self._hostCompleted) > 0:
+            self.finish(self._hostCompleted.popleft())
+        self.deliverIfDue(tickNbr)
+
+    ## a write already given to the host can't be taken back, so only an idle device is checkpointed
+    def getState(self):
+        if (len(self._activeChannels) > 0) or (len(self._batch) > 0):
+            raise Exception("Device {id} has host writes in flight, it can't be checkpointed".format(id=self._deviceId))
+        return super(FileIODevice, self).getState()
+
+    def shutdown(self):
+        if self._file.closed:
+            return
+        if len(self._batch) > 0:
+            self.__submitBatch()
+        self._pool.shutdown(wait=True)
+        self._file.close()
+
+    def __repr__(self):
+        return "FileIODevice {id} -> {path} writes: {writes} average host latency: {latency:.6f}s".format(id=self._deviceId, path=self._path, writes=self._hostWrites, latency=self.averageHostLatency)
+
+
+## emulates a DMA controller: copies blocks to/from memory without using the CPU
+class DMAController():
+
+    def __init__(self, memory, interruptVector, cellsPerTick):
+        self._memory = memory
+        self._interruptVector = interruptVector
+        self._cellsPerTick = cellsPerTick
+        self._transfers = deque()
+        self._current = None
+
+    @property
+    def cellsPerTick(self):
+        return self._cellsPerTick
+
+    @cellsPerTick.setter
+    def cellsPerTick(self, cellsPerTick):
+        self._cellsPerTick = cellsPerTick
+
+    @property
+    def is_idle(self):
+        return (self._current == None) and (len(self._transfers) == 0)
+
+    ## copies data into memory starting at addr, raises #DMA with the tag when finished
+    def write(self, addr, data, tag = None):
+        self._transfers.append({'op': 'write', 'addr': addr, 'data': list(data), 'length': len(data), 'done': 0, 'tag': tag})
+
+    ## copies length cells from memory starting at addr, the #DMA irq carries the data read
+    def read(self, addr, length, tag = None):
+        self._transfers.append({'op': 'read', 'addr': addr, 'data': [], 'length': length, 'done': 0, 'tag': tag})
+
+    ## tagIndexes: id of each transfer tag -> the number the checkpoint knows it by
+    def getState(self, tagIndexes):
+        transfers = []
+        if self._current != None:
+            transfers.append(self.__plainTransfer(self._current, tagIndexes))
+        for transfer in self._transfers:
+            transfers.append(self.__plainTransfer(transfer, tagIndexes))
+        return {'cellsPerTick': self._cellsPerTick, 'current': self._current != None, 'transfers': transfers}
+
+    ## tags: the tags by the number given in getState
+    def setState(self, state, tags):
+        self._cellsPerTick = state['cellsPerTick']
+        transfers = deque()
+        for transfer in state['transfers']:
+            transfer = dict(transfer)
+            transfer['data'] = list(transfer['data'])
+            if transfer['tag'] != None:
+                transfer['tag'] = tags[transfer['tag']]
+            transfers.append(transfer)
+        self._current = None
+        if state['current']:
+            self._current = transfers.popleft()
+        self._transfers = transfers
+
+    def __plainTransfer(self, transfer, tagIndexes):
+        plain = dict(transfer)
+        plain['data'] = list(transfer['data'])
+        if transfer['tag'] != None:
+            try:
+                plain['tag'] = tagIndexes[id(transfer['tag'])]
+            except KeyError:
+                raise Exception("Unknown tag in a DMA transfer, it can't be checkpointed")
+        return plain
+
+    def tick(self, tickNbr):
+        if (self._current == None) and (len(self._transfers) > 0):
+            self._current = self._transfers.popleft()
+        transfer = self._current
+        if (transfer == None):
+            return
+        addr = transfer['addr'] + transfer['done']
+        count = min(self._cellsPerTick, transfer['length'] - transfer['done'])
+        if (transfer['op'] == 'write'):
+            self._memory.putBlock(addr, transfer['data'][transfer['done']:transfer['done'] + count])
+        else:
+            transfer['data'].extend(self._memory.getBlock(addr, count))
+        transfer['done'] += count
+        if (transfer['done'] >= transfer['length']):
+            ## transfer finished
+            self._current = None
+            dmaIRQ = IRQ.create(DMA_INTERRUPTION_TYPE, {'tag': transfer['tag'], 'data': transfer['data']})
+            self._interruptVector.handle(dmaIRQ)
+        else:
+            log.logger.info("dma - {op} {done} of {length} cells".format(op=transfer['op'], done=transfer['done'], length=transfer['length']))
+
+
 class Timer:
 
     def __init__(self, cpu, interruptVector):
@@ -296,7 +1262,7 @@ class Timer:
         self._tickCount += 1
         if self._active and (self._tickCount > self._quantum) and self._cpu.isBusy():
             # se “cumplio” el limite de ejecuciones
-            timeoutIRQ = IRQ(TIMEOUT_INTERRUPTION_TYPE)
+            timeoutIRQ = IRQ.create(TIMEOUT_INTERRUPTION_TYPE)
             self._interruptVector.handle(timeoutIRQ)
         else:
             self._cpu.tick(tickNbr) 
@@ -304,6 +1270,14 @@ class Timer:
     def reset(self):
            self._tickCount = 0
 
+    def getState(self):
+        return {'tickCount': self._tickCount, 'active': self._active, 'quantum': self._quantum}
+
+    def setState(self, state):
+        self._tickCount = state['tickCount']
+        self._active = state['active']
+        self._quantum = state['quantum']
+
     @property
     def quantum(self):
         return self._quantum
@@ -318,26 +1292,97 @@ class Timer:
 class Hardware():
 
     ## Setup our hardware
-    def setup(self, memorySize):
+    ## asyncBackend = True runs the clock on an asyncio event loop instead of a Thread
+    ## deferredInterrupts = True queues the irqs and runs them by priority at the end of each tick
+    ## profiling = True times the irq handlers, the clock subscribers and the @profiled methods (see HARDWARE.profiler)
+    def setup(self, memorySize, dmaCellsPerTick = 4, asyncBackend = False, deferredInterrupts = False, profiling = False):
         ## add the components to the "motherboard"
         self._memory = Memory(memorySize)
-        self._interruptVector = InterruptVector()
-        self._clock = Clock()
+        self._interruptVector = InterruptVector(deferredInterrupts)
+        if asyncBackend:
+            self._clock = AsyncClock()
+        else:
+            self._clock = Clock()
+        if deferredInterrupts:
+            self._clock.interruptDispatcher = self._interruptVector
+        self._profiler = None
+        if profiling:
+            self._profiler = Profiler()
+            self._clock.profiler = self._profiler
+            self._interruptVector.profiler = self._profiler
+        self._switchOffSubscribers = []
+        self._ioDevices = dict()
         self._ioDevice = PrinterIODevice()
+        self._ioDevices[self._ioDevice.deviceId] = self._ioDevice
         self._mmu = MMU(self._memory)
         self._cpu = Cpu(self._mmu, self._interruptVector)
         self._timer = Timer(self._cpu, self._interruptVector)
-        self._clock.addSubscriber(self._ioDevice)
+        self._dma = DMAController(self._memory, self._interruptVector, dmaCellsPerTick)
+        self.__connectDevice(self._ioDevice)
+        self._clock.addSubscriber(self._dma)
         self._clock.addSubscriber(self._timer)
 
+    ## registers another I/O device and connects it to the clock
+    def addIODevice(self, device):
+        if device.deviceId in self._ioDevices:
+            raise Exception("Device {id} is already registered".format(id=device.deviceId))
+        self._ioDevices[device.deviceId] = device
+        self.__connectDevice(device)
+
+    def __connectDevice(self, device):
+        if self._clock.isAsync:
+            device.attachClock(self._clock)
+        else:
+            self._clock.addSubscriber(device)
+
+    def getIODevice(self, deviceId):
+        try:
+            return self._ioDevices[deviceId]
+        except KeyError:
+            raise Exception("Unknown device: {id}".format(id=deviceId))
+
     def switchOn(self):
         log.logger.info(" ---- SWITCH ON ---- ")
         return self.clock.start()
 
+    ## subscribers are told (switchedOff()) when the hardware is switched off
+    def addSwitchOffSubscriber(self, subscriber):
+        self._switchOffSubscribers.append(subscriber)
+
     def switchOff(self):
         self.clock.stop()
+        for device in self._ioDevices.values():
+            device.shutdown()
+        for subscriber in self._switchOffSubscribers:
+            subscriber.switchedOff()
         log.logger.info(" ---- SWITCH OFF ---- ")
 
+    ## plain copy of the state of every component, for a checkpoint (see so.Checkpointer)
+    ## tagIndexes: id of each DMA transfer tag -> the number the checkpoint knows it by
+    def getState(self, tagIndexes):
+        if self._clock.isAsync:
+            raise Exception("The asyncio backend can't be checkpointed")
+        devices = dict()
+        for deviceId, device in self._ioDevices.items():
+            devices[deviceId] = device.getState()
+        return {'clock': self._clock.getState(), 'interruptVector': self._interruptVector.getState(),
+                'memory': self._memory.getState(), 'mmu': self._mmu.getState(), 'cpu': self._cpu.getState(),
+                'timer': self._timer.getState(), 'dma': self._dma.getState(tagIndexes), 'ioDevices': devices}
+
+    ## the hardware must be setup like the one checkpointed, with the same devices, and switched off
+    def setState(self, state, tags):
+        if self._clock.isRunning:
+            raise Exception("The hardware must be switched off to restore a checkpoint")
+        for deviceId, deviceState in state['ioDevices'].items():
+            self.getIODevice(deviceId).setState(deviceState)
+        self._memory.setState(state['memory'])
+        self._mmu.setState(state['mmu'])
+        self._cpu.setState(state['cpu'])
+        self._timer.setState(state['timer'])
+        self._dma.setState(state['dma'], tags)
+        self._interruptVector.setState(state['interruptVector'])
+        self._clock.setState(state['clock'])
+
     @property
     def cpu(self):
         return self._cpu
@@ -358,14 +1403,32 @@ class Hardware():
     def mmu(self):
         return self._mmu
 
+    ## default device (the one used by ASM.IO() without deviceId)
     @property
     def ioDevice(self):
         return self._ioDevice
 
+    @property
+    def ioDevices(self):
+        return self._ioDevices
+
     @property
     def timer(self):
         return self._timer
 
+    @property
+    def dma(self):
+        return self._dma
+
+    ## None unless the hardware was setup with profiling = True
+    @property
+    def profiler(self):
+        return self._profiler
+
+    ## like repr, but the memory is shown with memory.dump()
+    def dump(self):
+        return "HARDWARE state {cpu}\n{mem}".format(cpu=self._cpu, mem=self._memory.dump())
+
     def __repr__(self):
         return "HARDWARE state {cpu}\n{mem}".format(cpu=self._cpu, mem=self._memory)
 
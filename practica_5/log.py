@@ -9,3 +9,9 @@ def setupLogger():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
     logger.setLevel(logging.DEBUG)
+
+## logs dumpable.dump() only if INFO is logged: a dump renders the whole memory and
+## an incremental one consumes the changes, that would be lost if nobody sees them
+def infoDump(dumpable):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(dumpable.dump())
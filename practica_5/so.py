@@ -2,7 +2,15 @@
 
 from hardware import *
 import log
-import math
+import heapq
+import os
+import json
+import csv
+import pickle
+import zlib
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
 
 
 
@@ -46,40 +54,364 @@ class Program():
         return "Program({name}, {instructions})".format(name=self._name, instructions=self._instructions)
 
 
+## counts values in power of two buckets: 0, 1, 2-3, 4-7, 8-15...
+class Histogram():
+
+    def __init__(self):
+        self._buckets = {}
+        self._count = 0
+        self._total = 0
+        self._max = 0
+
+    def add(self, value):
+        bucket = int(value).bit_length()
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+        self._count += 1
+        self._total += value
+        self._max = max(self._max, value)
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        if self._count == 0:
+            return 0.0
+        return self._total / self._count
+
+    @property
+    def max(self):
+        return self._max
+
+    ## upper bound of the bucket where the percentile falls
+    def percentile(self, p):
+        if self._count == 0:
+            return 0
+        wanted = p / 100 * self._count
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= wanted:
+                return min((1 << bucket) - 1, self._max)
+        return self._max
+
+    def buckets(self):
+        ranges = []
+        for bucket in sorted(self._buckets):
+            low = 0 if bucket == 0 else 1 << (bucket - 1)
+            ranges.append(("{low}-{high}".format(low=low, high=max((1 << bucket) - 1, low)), self._buckets[bucket]))
+        return ranges
+
+    def __repr__(self):
+        return "Histogram(count={count}, mean={mean:.2f}, max={max}, buckets={buckets})".format(count=self._count, mean=self.mean, max=self._max, buckets=self.buckets())
+
+## orders the requests waiting for a device by their position (ej: the disk track)
+class IoScheduler():
+
+    def __init__(self):
+        self._count = 0
+
+    def add(self, position, item, head):
+        pass
+
+    def next(self, head):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def isEmpty(self):
+        return len(self) == 0
+
+    def items(self):
+        return []
+
+    ## encode / decode turn each item into plain data and back (for a checkpoint)
+    def getState(self, encode):
+        return {'count': self._count}
+
+    def setState(self, state, decode):
+        self._count = state['count']
+
+    def __repr__(self):
+        return "{name}({items})".format(name=self.__class__.__name__, items=self.items())
+
+class FCFSIoScheduler(IoScheduler):
+
+    def __init__(self):
+        super().__init__()
+        self._queue = deque()
+
+    def add(self, position, item, head):
+        self._queue.append(item)
+
+    def next(self, head):
+        return self._queue.popleft()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def items(self):
+        return list(self._queue)
+
+    def getState(self, encode):
+        return {'count': self._count, 'queue': [encode(item) for item in self._queue]}
+
+    def setState(self, state, decode):
+        self._count = state['count']
+        self._queue = deque([decode(item) for item in state['queue']])
+
+## keeps the requests above the head in a min-heap and the ones below in a max-heap
+class HeadOrderedIoScheduler(IoScheduler):
+
+    def __init__(self):
+        super().__init__()
+        self._up = []
+        self._down = []
+
+    def add(self, position, item, head):
+        ## el contador desempata por orden de llegada
+        if(position >= head):
+            heapq.heappush(self._up, (position, self._count, item))
+        else:
+            heapq.heappush(self._down, (-position, self._count, item))
+        self._count += 1
+
+    def popUp(self):
+        return heapq.heappop(self._up)[2]
+
+    def popDown(self):
+        return heapq.heappop(self._down)[2]
+
+    def __len__(self):
+        return len(self._up) + len(self._down)
+
+    def items(self):
+        return [entry[2] for entry in sorted(self._up)] + [entry[2] for entry in sorted(self._down)]
+
+    ## the heaps are saved as they are, so the requests keep the side of the head they were added to
+    def getState(self, encode):
+        return {'count': self._count,
+                'up': [(key, count, encode(item)) for key, count, item in self._up],
+                'down': [(key, count, encode(item)) for key, count, item in self._down]}
+
+    def setState(self, state, decode):
+        self._count = state['count']
+        self._up = [(key, count, decode(item)) for key, count, item in state['up']]
+        self._down = [(key, count, decode(item)) for key, count, item in state['down']]
+
+## shortest seek time first
+class SSTFIoScheduler(HeadOrderedIoScheduler):
+
+    def next(self, head):
+        if(len(self._down) == 0):
+            return self.popUp()
+        if(len(self._up) == 0):
+            return self.popDown()
+        if(self._up[0][0] - head <= head + self._down[0][0]):
+            return self.popUp()
+        return self.popDown()
+
+## elevator (LOOK): keeps moving in one direction while there are requests that way,
+## it turns around at the last request instead of going on to the edge of the disk
+class LookIoScheduler(HeadOrderedIoScheduler):
+
+    def __init__(self):
+        super().__init__()
+        self._goingUp = True
+
+    def next(self, head):
+        if(self._goingUp and len(self._up) == 0):
+            self._goingUp = False
+        elif(not self._goingUp and len(self._down) == 0):
+            self._goingUp = True
+        if(self._goingUp):
+            return self.popUp()
+        return self.popDown()
+
+    def getState(self, encode):
+        state = super().getState(encode)
+        state['goingUp'] = self._goingUp
+        return state
+
+    def setState(self, state, decode):
+        super().setState(state, decode)
+        self._goingUp = state['goingUp']
+
+## circular look: serves going up, then jumps back to the lowest request
+class CLookIoScheduler(IoScheduler):
+
+    def __init__(self):
+        super().__init__()
+        self._up = []
+        self._nextSweep = []
+
+    def add(self, position, item, head):
+        if(position >= head):
+            heapq.heappush(self._up, (position, self._count, item))
+        else:
+            heapq.heappush(self._nextSweep, (position, self._count, item))
+        self._count += 1
+
+    def next(self, head):
+        if(len(self._up) == 0):
+            self._up = self._nextSweep
+            self._nextSweep = []
+        return heapq.heappop(self._up)[2]
+
+    def __len__(self):
+        return len(self._up) + len(self._nextSweep)
+
+    def items(self):
+        return [entry[2] for entry in sorted(self._up)] + [entry[2] for entry in sorted(self._nextSweep)]
+
+    def getState(self, encode):
+        return {'count': self._count,
+                'up': [(key, count, encode(item)) for key, count, item in self._up],
+                'nextSweep': [(key, count, encode(item)) for key, count, item in self._nextSweep]}
+
+    def setState(self, state, decode):
+        self._count = state['count']
+        self._up = [(key, count, decode(item)) for key, count, item in state['up']]
+        self._nextSweep = [(key, count, decode(item)) for key, count, item in state['nextSweep']]
+
+
 ## emulates an Input/Output device controller (driver)
 class IoDeviceController():
 
-    def __init__(self, device):
+    def __init__(self, device, ioScheduler = None):
         self._device = device
-        self._waiting_queue = []
-        self._currentPCB = None
+        if (ioScheduler == None):
+            ioScheduler = FCFSIoScheduler()
+        self._waiting_queue = ioScheduler
+        ## channel of the device -> pcb whose operation runs there
+        self._runningPCBs = {}
+        self._dispatchTicks = {}
+        ## per request: ticks in the queue and ticks in the device
+        self._waitTimes = Histogram()
+        self._serviceTimes = Histogram()
+        ## queue length over time (area = sum of length * ticks)
+        self._queueArea = 0
+        self._queueChanged = HARDWARE.clock.currentTick
+        self._queueLength = 0
+        self._maxQueueLength = 0
+
+    @property
+    def device(self):
+        return self._device
+
+    @property
+    def ioScheduler(self):
+        return self._waiting_queue
+
+    @ioScheduler.setter
+    def ioScheduler(self, ioScheduler):
+        ## los pedidos pendientes pasan al nuevo scheduler
+        head = self._device.headPosition
+        for pair in self._waiting_queue.items():
+            ioScheduler.add(self._device.positionOf(pair['instruction']), pair, head)
+        self._waiting_queue = ioScheduler
 
     def runOperation(self, pcb, instruction):
-        pair = {'pcb': pcb, 'instruction': instruction}
-        # append: adds the element at the end of the queue
-        self._waiting_queue.append(pair)
+        pair = {'pcb': pcb, 'instruction': instruction, 'arrival': HARDWARE.clock.currentTick}
+        # the io scheduler decides the order using the position (track) of the operation
+        self._waiting_queue.add(self._device.positionOf(instruction), pair, self._device.headPosition)
+        self.__queueLengthChanged()
         # try to send the instruction to hardware's device (if is idle)
         self.__load_from_waiting_queue_if_apply()
 
-    def getFinishedPCB(self):
-        finishedPCB = self._currentPCB
-        self._currentPCB = None
+    ## channels: the device channels reported by the #IO_OUT (in order of completion)
+    def getFinishedPCBs(self, channels):
+        finishedPCBs = []
+        for channel in channels:
+            finishedPCBs.append(self._runningPCBs.pop(channel))
+            self._serviceTimes.add(HARDWARE.clock.currentTick - self._dispatchTicks.pop(channel))
         self.__load_from_waiting_queue_if_apply()
-        return finishedPCB
+        return finishedPCBs
+
+    def __queueLengthChanged(self):
+        now = HARDWARE.clock.currentTick
+        self._queueArea += self._queueLength * (now - self._queueChanged)
+        self._queueChanged = now
+        self._queueLength = len(self._waiting_queue)
+        self._maxQueueLength = max(self._maxQueueLength, self._queueLength)
+
+    ## a channel is free for the controller once its #IO_OUT was handled: with deferred
+    ## interrupts the device frees it before that and an #IO_IN of the same tick could take it
+    def __freeChannel(self):
+        for channel in self._device.freeChannels:
+            if channel not in self._runningPCBs:
+                return channel
+        return None
 
     def __load_from_waiting_queue_if_apply(self):
-        if (len(self._waiting_queue) > 0) and self._device.is_idle:
-            ## pop(): extracts (deletes and return) the first element in queue
-            pair = self._waiting_queue.pop(0)
-            #print(pair)
+        ## every free channel of the device gets a request
+        channel = self.__freeChannel()
+        while (not self._waiting_queue.isEmpty()) and channel != None:
+            pair = self._waiting_queue.next(self._device.headPosition)
             pcb = pair['pcb']
             instruction = pair['instruction']
-            self._currentPCB = pcb
-            self._device.execute(instruction)
+            self._waitTimes.add(HARDWARE.clock.currentTick - pair['arrival'])
+            self._device.execute(instruction, channel)
+            self._runningPCBs[channel] = pcb
+            self._dispatchTicks[channel] = HARDWARE.clock.currentTick
+            self.__queueLengthChanged()
+            channel = self.__freeChannel()
+
+    ## the pcbs are saved by pid (the wait and service histograms are not saved)
+    def getState(self):
+        running = dict()
+        for channel, pcb in self._runningPCBs.items():
+            running[channel] = pcb.pid
+        return {'ioScheduler': self._waiting_queue.__class__.__name__,
+                'waiting': self._waiting_queue.getState(self.__encodeRequest),
+                'running': running, 'dispatchTicks': dict(self._dispatchTicks),
+                'queueArea': self._queueArea, 'queueChanged': self._queueChanged,
+                'queueLength': self._queueLength, 'maxQueueLength': self._maxQueueLength}
+
+    ## the controller must have the same io scheduler the checkpointed one had
+    def setState(self, state, pcbTable):
+        if state['ioScheduler'] != self._waiting_queue.__class__.__name__:
+            raise Exception("Device {id} uses {current}, the checkpoint was taken with {saved}".format(id=self._device.deviceId, current=self._waiting_queue.__class__.__name__, saved=state['ioScheduler']))
+        self._waiting_queue.setState(state['waiting'], lambda request: {'pcb': pcbTable.getPid(request[0]), 'instruction': request[1], 'arrival': request[2]})
+        self._runningPCBs = dict()
+        for channel, pid in state['running'].items():
+            self._runningPCBs[channel] = pcbTable.getPid(pid)
+        self._dispatchTicks = dict(state['dispatchTicks'])
+        self._queueArea = state['queueArea']
+        self._queueChanged = state['queueChanged']
+        self._queueLength = state['queueLength']
+        self._maxQueueLength = state['maxQueueLength']
+
+    def __encodeRequest(self, pair):
+        return (pair['pcb'].pid, pair['instruction'], pair['arrival'])
+
+    ## average ticks a request waited in the queue before reaching the device
+    @property
+    def averageWait(self):
+        return self._waitTimes.mean
 
+    @property
+    def waitTimes(self):
+        return self._waitTimes
+
+    @property
+    def serviceTimes(self):
+        return self._serviceTimes
+
+    @property
+    def maxQueueLength(self):
+        return self._maxQueueLength
+
+    @property
+    def averageQueueLength(self):
+        now = HARDWARE.clock.currentTick
+        area = self._queueArea + self._queueLength * (now - self._queueChanged)
+        return area / (now + 1)
 
     def __repr__(self):
-        return "IoDeviceController for {deviceID} running: {currentPCB} waiting: {waiting_queue}".format(deviceID=self._device.deviceId, currentPCB=self._currentPCB, waiting_queue=self._waiting_queue)
+        return "IoDeviceController for {deviceID} running: {runningPCBs} waiting: {waiting_queue} average wait: {wait:.2f}".format(deviceID=self._device.deviceId, runningPCBs=self._runningPCBs, waiting_queue=self._waiting_queue, wait=self.averageWait)
 
 ## emulates the  Interruptions Handlers
 class AbstractInterruptionHandler():
@@ -93,22 +425,44 @@ class AbstractInterruptionHandler():
     def execute(self, irq):
         log.logger.error("-- EXECUTE MUST BE OVERRIDEN in class {classname}".format(classname=self.__class__.__name__))
 
+    ## puts a loaded pcb to run or in the ready queue (expropiating if the scheduler says so)
+    def admit(self,pcb):
+        runningPCB = self.kernel.pcbTable.runningPCB
+        if(runningPCB == None):
+           pcb.state = "running"
+           self.kernel.pcbTable.runningPCB = pcb
+           self.kernel.dispatcher.load(pcb,self.kernel.memoryManager.getPageTable(pcb.pid))
+        else:
+           if(not self.kernel.scheduler.mustExpropiated(runningPCB,pcb)):
+            pcb.state = "ready"
+            self.kernel.scheduler.add(pcb)
+           else:
+            expropiatedPCB = runningPCB
+            expropiatedPCB.state = "ready"
+            self.kernel.dispatcher.save(expropiatedPCB)
+            self.kernel.scheduler.add(expropiatedPCB)
+            pcb.state = "running"
+            self.kernel.pcbTable.runningPCB = pcb
+            self.kernel.dispatcher.load(pcb,self.kernel.memoryManager.getPageTable(pcb.pid))
+
 
 class KillInterruptionHandler(AbstractInterruptionHandler):
 
     def execute(self, irq):
 
-        frameToFree = []
         log.logger.info(" Program Finished ")
         killedPCB = self.kernel.pcbTable.runningPCB
         self.kernel.dispatcher.save(killedPCB)
-        for key, value in self.kernel.memoryManager.getPageTable(killedPCB.pid).pageTable.items():
-            frameToFree.append(value)
-        self.kernel.memoryManager.freeFrame(frameToFree)
+        self.kernel.loader.unload(killedPCB)
         killedPCB.state = "terminated"
         self.kernel.pcbTable.runningPCB = None
         log.logger.error("freeFrameList :")
-        log.logger.info(self.kernel.memoryManager)
+        log.infoDump(self.kernel.memoryManager)
+        ## con los frames liberados intentamos admitir a los que esperan memoria
+        for admittedPCB in self.kernel.admissionQueue.admit(self.kernel.loader):
+            if(self.kernel.loader.isLoaded(admittedPCB)):
+                admittedPCB.state = "ready"
+                self.kernel.scheduler.add(admittedPCB)
         if(not self.kernel.scheduler.isEmpty()):
             nextPCB = self.kernel.scheduler.getNext()
             nextPCB.state = "running"
@@ -121,74 +475,69 @@ class IoInInterruptionHandler(AbstractInterruptionHandler):
     def execute(self, irq):
 
         program = irq.parameters
+        controller = self.kernel.ioDeviceControllerFor(ASM.deviceOf(program))
         pcb = self.kernel.pcbTable.runningPCB
         pcb.state = "waiting"
         self.kernel.dispatcher.save(pcb)
         self.kernel.pcbTable.runningPCB = None
-        self.kernel.ioDeviceController.runOperation(pcb, program)
+        controller.runOperation(pcb, program)
         if(not self.kernel.scheduler.isEmpty()):
          nextPCB = self.kernel.scheduler.getNext()
          nextPCB.state = "running"
          self.kernel.pcbTable.runningPCB = nextPCB
          self.kernel.dispatcher.load(nextPCB,self.kernel.memoryManager.getPageTable(nextPCB.pid))
-        log.logger.info(self.kernel.ioDeviceController)
+        log.logger.info(controller)
 
 
 class IoOutInterruptionHandler(AbstractInterruptionHandler):
 
     def execute(self, irq):
 
-       pcb = self.kernel.ioDeviceController.getFinishedPCB()
-       if(self.kernel.pcbTable.runningPCB == None):
-           pcb.state = "running"
-           self.kernel.pcbTable.runningPCB = pcb
-           self.kernel.dispatcher.load(pcb,self.kernel.memoryManager.getPageTable(pcb.pid))
-       else:
-           if(not self.kernel.scheduler.mustExpropiated(self.kernel.pcbTable.runningPCB,pcb)):
-            pcb.state = "ready"
-            self.kernel.scheduler.add(pcb)
-           else:
-               expropiatedPCB = self.kernel.pcbTable.runningPCB
-               expropiatedPCB.state = "ready"
-               self.kernel.dispatcher.save(expropiatedPCB)
-               self.kernel.scheduler.add(expropiatedPCB)
-               pcb.state = "running"
-               self.kernel.pcbTable.runningPCB = pcb
-               self.kernel.dispatcher.load(pcb,self.kernel.memoryManager.getPageTable(pcb.pid))
+       controller = self.kernel.ioDeviceControllerFor(irq.parameters.get('deviceId'))
+       ## con coalescing un solo irq trae varios pcbs terminados
+       for pcb in controller.getFinishedPCBs(irq.parameters.get('channels')):
+           self.admit(pcb)
 
 class NewInterruptHandler(AbstractInterruptionHandler):
 
     def execute(self,irq):
 
         priority = irq.parameters.get('priority')
-        pcb = Pcb(self.kernel.pcbTable.getNewPID(),priority)
-        runningPCB = self.kernel.pcbTable.runningPCB
-        pcb.path = irq.parameters.get('path')
-        self.kernel.loader.load(pcb)
+        path = irq.parameters.get('path')
+        pages = self.kernel.loader.pagesFor(path)
+        if(pages > self.kernel.memoryManager.frameCount):
+            log.logger.error("Program {path} needs {pages} frames, memory only has {frames}".format(path=path, pages=pages, frames=self.kernel.memoryManager.frameCount))
+            return
+        pcb = Pcb(self.kernel.pcbTable.getNewPID(),priority,self.kernel)
+        pcb.path = path
         self.kernel.pcbTable.add(pcb)
-        if(runningPCB == None):
-           pcb.state = "running"
-           self.kernel.pcbTable.runningPCB = pcb
-           self.kernel.dispatcher.load(pcb,self.kernel.memoryManager.getPageTable(pcb.pid))
-           self.kernel.ganttDiagram.addToTable(pcb)
-        else:
-           if(not self.kernel.scheduler.mustExpropiated(runningPCB,pcb)):
-            pcb.state = "ready"
-            self.kernel.scheduler.add(pcb)
-            self.kernel.ganttDiagram.addToTable(pcb)
-           else:
-            print(pcb.pid)
-            expropiatedPCB = runningPCB
-            expropiatedPCB.state = "ready"
-            self.kernel.dispatcher.save(expropiatedPCB)
-            self.kernel.scheduler.add(expropiatedPCB)
-            pcb.state = "running"
-            self.kernel.pcbTable.runningPCB = pcb
-            self.kernel.dispatcher.load(pcb,self.kernel.memoryManager.getPageTable(pcb.pid))
-            self.kernel.ganttDiagram.addToTable(pcb)
-
+        ## el pcb queda en estado "new" hasta que haya frames para cargarlo
+        self.kernel.admissionQueue.add(pcb, pages)
+        for admittedPCB in self.kernel.admissionQueue.admit(self.kernel.loader):
+            ## si el loader usa DMA el pcb se despacha cuando termina la copia
+            if(self.kernel.loader.isLoaded(admittedPCB)):
+                self.admit(admittedPCB)
+        self.kernel.ganttDiagram.addToTable(pcb)
+        if(not self.kernel.admissionQueue.isEmpty()):
+            log.logger.info(self.kernel.admissionQueue)
         log.logger.info(self.kernel.pcbTable)
-        log.logger.info(self.kernel.memoryManager)
+        log.infoDump(self.kernel.memoryManager)
+
+
+class DmaInterruptionHandler(AbstractInterruptionHandler):
+
+    ## the pages copied by the loader admit their pcbs, the other transfers go to the dma listeners
+    def execute(self, irq):
+
+        tag = irq.parameters.get('tag')
+        if(self.kernel.loader.ownsTransfer(tag)):
+            for loadedPCB in self.kernel.loader.blockTransferred(tag):
+                self.admit(loadedPCB)
+        elif(len(self.kernel.dmaListeners) == 0):
+            log.logger.info("dma transfer {tag} finished, nobody is waiting for it".format(tag=tag))
+        else:
+            for listener in self.kernel.dmaListeners:
+                listener.transferred(tag, irq.parameters.get('data'))
 
 class TimeoutInterruptionHandler(AbstractInterruptionHandler):
 
@@ -209,25 +558,57 @@ class TimeoutInterruptionHandler(AbstractInterruptionHandler):
 
 class Dispatcher():
 
+    def __init__(self):
+        self._contextSwitches = 0
+
+    @property
+    def contextSwitches(self):
+        return self._contextSwitches
+
+    @profiled("Dispatcher.load")
     def load(self,pcb,pageTableDelPCB):
 
+        self._contextSwitches += 1
         HARDWARE.mmu.resetTLB()
-        for page in pageTableDelPCB.pageTable:
-         HARDWARE.mmu.setPageFrame(page,pageTableDelPCB.pageTable[page])
+        for page, frame in pageTableDelPCB.items():
+         HARDWARE.mmu.setPageFrame(page,frame)
         HARDWARE.timer.reset()
         HARDWARE.cpu.pc = pcb.pc
 
+    @profiled("Dispatcher.save")
     def save(self,pcb):
 
         pcb.pc = HARDWARE.cpu.pc
         HARDWARE.cpu.pc = -1
 
+## the dequeued nodes go back to a free list and Node.create reuses them
 class Node():
 
+    __slots__ = ('_value', '_next')
+
+    _pool = []
+    _poolMaxSize = 4096
+
     def __init__(self,value):
         self._value = value
         self._next = None
 
+    @classmethod
+    def create(cls, value):
+        try:
+            node = cls._pool.pop()
+        except IndexError:
+            return cls(value)
+        node._value = value
+        return node
+
+    @classmethod
+    def release(cls, node):
+        node._value = None
+        node._next = None
+        if len(cls._pool) < cls._poolMaxSize:
+            cls._pool.append(node)
+
     @property
     def value(self):
         return self._value
@@ -252,17 +633,19 @@ class Queue():
         self._size = 0
 
     def dequeue(self):
-       temp = self._head.value
+       node = self._head
+       temp = node.value
        if(self._size == 1):
            self._head = None
            self._tail = None
        else:
-           self._head = self._head.next
+           self._head = node.next
        self._size-=1
+       Node.release(node)
        return temp
 
     def enqueue(self,item):
-       temp = Node(item)
+       temp = Node.create(item)
        if(self.isEmpty()):
          self._head = temp
          self._tail = temp
@@ -274,28 +657,136 @@ class Queue():
     def isEmpty(self):
         return self._size == 0
 
+    def __len__(self):
+        return self._size
+
     def peek(self):
         return self._head.value
 
+    ## the values from the head to the tail
+    def items(self):
+        values = []
+        node = self._head
+        while node != None:
+            values.append(node.value)
+            node = node.next
+        return values
+
 class FileSystem():
 
     def __init__(self):
         self._dirs = {}
+        self._subscribers = []
+
+    def addSubscriber(self, subscriber):
+        self._subscribers.append(subscriber)
 
     def write(self,path,program):
         self._dirs[path]=program
+        ## avisamos a los subscriptores (ej: el cache de imagenes) que cambio el path
+        for subscriber in self._subscribers:
+            subscriber.written(path)
 
     def read(self,path):
         return self._dirs.get(path)
 
+    ## path -> (name, instructions)
+    def getState(self):
+        ## list(): the programs may be written from another thread meanwhile
+        return {path: (program.name, list(program.instructions)) for path, program in list(self._dirs.items())}
+
+    ## the subscribers are not told, the image cache is restored by the loader
+    def setState(self, state):
+        self._dirs = {path: Program(name, instructions) for path, (name, instructions) in state.items()}
+
+## caches every program already split in frame-sized pages
+class ProgramImageCache():
+
+    def __init__(self, fileSystem, frameSize):
+        self._fileSystem = fileSystem
+        self._frameSize = frameSize
+        self._images = {}
+        self._hits = 0
+        self._misses = 0
+        fileSystem.addSubscriber(self)
+
+    def pagesFor(self, path):
+        pages = self._images.get(path)
+        if(pages == None):
+            self._misses += 1
+            instructions = self._fileSystem.read(path).instructions
+            frameSize = self._frameSize
+            pages = [instructions[i:i+frameSize] for i in range(0, len(instructions), frameSize)]
+            self._images[path] = pages
+        else:
+            self._hits += 1
+        return pages
+
+    ## number of pages of the program, without splitting or caching it and without counting a hit or miss
+    ## (the admission size check is not a use of the image)
+    def pageCountOf(self, path):
+        pages = self._images.get(path)
+        if(pages != None):
+            return len(pages)
+        return -(-len(self._fileSystem.read(path).instructions) // self._frameSize)
+
+    def written(self, path):
+        self._images.pop(path, None)
+
+    ## the pages of the path if they are cached (None if not), without counting a hit
+    def cachedPages(self, path):
+        return self._images.get(path)
+
+    ## the pages are never modified once split, so they are not copied
+    def getState(self):
+        return {'images': dict(self._images), 'hits': self._hits, 'misses': self._misses}
+
+    def setState(self, state):
+        self._images = dict(state['images'])
+        self._hits = state['hits']
+        self._misses = state['misses']
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def hitRate(self):
+        total = self._hits + self._misses
+        if(total == 0):
+            return 0.0
+        return self._hits / total
+
+    def __repr__(self):
+        return "ProgramImageCache images: {images} hits: {hits} misses: {misses} hitRate: {rate:.2f}".format(images=len(self._images), hits=self._hits, misses=self._misses, rate=self.hitRate)
+
 class Pcb():
 
-    def __init__(self, pid, priority):
+    __slots__ = ('_pid', '_pc', '_priority', '_state', '_path', '_stateListener',
+                 '_creationTick', '_lastChangeTick', '_firstDispatchTick', '_terminationTick',
+                 '_newTicks', '_readyTicks', '_runningTicks', '_waitingTicks')
+
+    def __init__(self, pid, priority, stateListener = None):
         self._pid = pid
         self._pc = 0
         self._priority = priority
         self._state = "new"
         self._path = ""
+        ## is told every state change (stateChanged(pcb, oldState, newState))
+        self._stateListener = stateListener
+        ## ticks spent in each state, added up on every state change
+        self._creationTick = HARDWARE.clock.currentTick
+        self._lastChangeTick = self._creationTick
+        self._firstDispatchTick = None
+        self._terminationTick = None
+        self._newTicks = 0
+        self._readyTicks = 0
+        self._runningTicks = 0
+        self._waitingTicks = 0
 
     @property
     def pid(self):
@@ -308,7 +799,71 @@ class Pcb():
 
     @state.setter
     def state(self, state):
+        oldState = self._state
         self._state = state
+        if oldState != state:
+            self.__accountTicks(oldState, state)
+        if (self._stateListener != None) and (oldState != state):
+            self._stateListener.stateChanged(self, oldState, state)
+
+    def __accountTicks(self, oldState, newState):
+        now = HARDWARE.clock.currentTick
+        elapsed = now - self._lastChangeTick
+        self._lastChangeTick = now
+        if oldState == "running":
+            self._runningTicks += elapsed
+        elif oldState == "ready":
+            self._readyTicks += elapsed
+        elif oldState == "waiting":
+            self._waitingTicks += elapsed
+        elif oldState == "new":
+            self._newTicks += elapsed
+        if newState == "running" and self._firstDispatchTick == None:
+            self._firstDispatchTick = now
+        elif newState == "terminated":
+            self._terminationTick = now
+
+    @property
+    def creationTick(self):
+        return self._creationTick
+
+    @property
+    def firstDispatchTick(self):
+        return self._firstDispatchTick
+
+    @property
+    def terminationTick(self):
+        return self._terminationTick
+
+    ## ticks waiting for memory (admission queue)
+    @property
+    def newTicks(self):
+        return self._newTicks
+
+    @property
+    def readyTicks(self):
+        return self._readyTicks
+
+    @property
+    def runningTicks(self):
+        return self._runningTicks
+
+    ## ticks waiting for I/O
+    @property
+    def waitingTicks(self):
+        return self._waitingTicks
+
+    @property
+    def turnaroundTime(self):
+        if self._terminationTick == None:
+            return None
+        return self._terminationTick - self._creationTick
+
+    @property
+    def responseTime(self):
+        if self._firstDispatchTick == None:
+            return None
+        return self._firstDispatchTick - self._creationTick
 
     @property
     def path(self):
@@ -330,6 +885,73 @@ class Pcb():
     def priority(self):
        return self._priority
 
+    ## every field but the state listener
+    def getState(self):
+        return {slot: getattr(self, slot) for slot in Pcb.__slots__ if slot != '_stateListener'}
+
+    def setState(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+## turnaround, waiting and response time of the terminated pcbs, collected as they terminate
+## (waiting time = ticks in the ready queue)
+class SchedulingMetrics():
+
+    def __init__(self):
+        self._turnaround = []
+        self._waiting = []
+        self._response = []
+        self._runningTicks = 0
+        self._firstCreation = None
+        self._lastTermination = None
+
+    def stateChanged(self, pcb, oldState, newState):
+        if newState != "terminated":
+            return
+        self._turnaround.append(pcb.turnaroundTime)
+        self._waiting.append(pcb.readyTicks)
+        self._response.append(pcb.responseTime if pcb.responseTime != None else pcb.turnaroundTime)
+        self._runningTicks += pcb.runningTicks
+        if self._firstCreation == None or pcb.creationTick < self._firstCreation:
+            self._firstCreation = pcb.creationTick
+        self._lastTermination = pcb.terminationTick
+
+    @property
+    def terminated(self):
+        return len(self._turnaround)
+
+    def __stats(self, values):
+        if len(values) == 0:
+            return {'mean': 0.0, 'p50': 0, 'p90': 0, 'p99': 0, 'max': 0}
+        ordered = sorted(values)
+        last = len(ordered) - 1
+        return {'mean': sum(ordered) / len(ordered),
+                'p50': ordered[int(last * 0.50)],
+                'p90': ordered[int(last * 0.90)],
+                'p99': ordered[int(last * 0.99)],
+                'max': ordered[last]}
+
+    def summary(self):
+        elapsed = 0
+        if self._firstCreation != None:
+            elapsed = self._lastTermination - self._firstCreation + 1
+        return {'terminated': self.terminated,
+                'turnaround': self.__stats(self._turnaround),
+                'waiting': self.__stats(self._waiting),
+                'response': self.__stats(self._response),
+                'throughput': self.terminated / elapsed if elapsed > 0 else 0.0,
+                'cpuUtilization': self._runningTicks / elapsed if elapsed > 0 else 0.0}
+
+    def __repr__(self):
+        summary = self.summary()
+        rows = []
+        for name in ['turnaround', 'waiting', 'response']:
+            stats = summary[name]
+            rows.append([name, "{:.2f}".format(stats['mean']), stats['p50'], stats['p90'], stats['p99'], stats['max']])
+        table = tabulate(rows, headers=["ticks", "mean", "p50", "p90", "p99", "max"], tablefmt='psql')
+        return "{table}\nterminated: {terminated} throughput: {throughput:.3f} pcbs/tick cpu utilization: {cpu:.1%}".format(
+            table=table, terminated=summary['terminated'], throughput=summary['throughput'], cpu=summary['cpuUtilization'])
+
 class PCBTable():
 
     def __init__(self):
@@ -341,6 +963,10 @@ class PCBTable():
         self._pid  += 1
         return self._pid
 
+    @property
+    def lastPID(self):
+        return self._pid
+
     @property
     def runningPCB(self):
         return self._runningPCB
@@ -358,94 +984,355 @@ class PCBTable():
     def remove(self,pid):
         self._pcbTable[pid]
 
+    def getState(self):
+        running = None
+        if self._runningPCB != None:
+            running = self._runningPCB.pid
+        return {'pcbs': [pcb.getState() for pcb in self._pcbTable.values()], 'running': running, 'lastPID': self._pid}
+
+    ## the restored pcbs tell their state changes to the stateListener (the kernel)
+    def setState(self, state, stateListener):
+        self._pcbTable = {}
+        for pcbState in state['pcbs']:
+            pcb = Pcb(pcbState['_pid'], pcbState['_priority'], stateListener)
+            pcb.setState(pcbState)
+            self.add(pcb)
+        self._runningPCB = None
+        if state['running'] != None:
+            self._runningPCB = self._pcbTable[state['running']]
+        self._pid = state['lastPID']
+
+    def __len__(self):
+        return len(self._pcbTable)
+
     def allTerminated(self):
         estanTerminados = True
         for pid in self._pcbTable:
             estanTerminados = estanTerminados and self._pcbTable[pid].state == 'terminated'
         return estanTerminados
     def __repr__(self):
-        return tabulate(enumerate(self._pcbTable),"pcbTable for {pcbTable} running : {runningPCB}".format(pcbTable = self._pcbTable, runningPCB=self._runningPCB))
+        return tabulate(enumerate(self._pcbTable),"pcbTable for {pcbTable} running : {runningPCB}".format(pcbTable = self._pcbTable, runningPCB=self._runningPCB), coltypes=[int, int])
 
 class MemoryManager():
 
     def __init__(self,frameSize):
-        self._freeFrameList = []
-        self._usedFrames = []
         self._pageTable = {}
         self._frameSize = frameSize
         HARDWARE.mmu.frameSize = frameSize
-        frameId = 0
-        while frameId < HARDWARE.memory.memorySize()/frameSize:
-            self._freeFrameList.append(frameId)
-            frameId += 1
+        self._frameCount = HARDWARE.memory.memorySize() // frameSize
+        ## los frames libres se guardan como una pila (alloc/free en O(1) por frame)
+        ## y el bitmap dice en O(1) si un frame esta libre (1) o usado (0)
+        self._freeFrameList = list(range(self._frameCount))
+        self._freeBitmap = bytearray(b'\x01') * self._frameCount
+        ## frames taken and freed since the last dump (None: every dump is the whole free list)
+        self._allocatedSinceDump = None
+        self._freedSinceDump = None
+        self._changesDropped = False
+        self._fullDumpEvery = None
+        self._dumps = 0
 
     def allocFrame(self,index):
-        self._frameToUse = []
-        for i in range(0,index):
-            self._frameToUse.append(self._freeFrameList.pop())
-        self._usedFrames.extend(self._frameToUse)
-        return self._frameToUse
+        if(not self.adequateFrames(index)):
+            raise Exception("Not enough free frames, requested: {index} free: {free}".format(index=index, free=self.freeFrameCount))
+        start = len(self._freeFrameList) - index
+        frames = self._freeFrameList[start:]
+        frames.reverse()
+        del self._freeFrameList[start:]
+        for f in frames:
+            self._freeBitmap[f] = 0
+        if self._allocatedSinceDump is not None:
+            self._allocatedSinceDump.extend(frames)
+            self.__dropChangesIfTooMany()
+        return frames
 
     def freeFrame(self,frames):
+        ## se validan todos antes de tocar nada, asi un error no deja la pila y el bitmap inconsistentes
+        seen = set()
+        for f in frames:
+            if(self._freeBitmap[f] or f in seen):
+                raise Exception("Frame {frame} is already free".format(frame=f))
+            seen.add(f)
         for f in frames:
-            self._usedFrames.remove(f)
+            self._freeBitmap[f] = 1
         self._freeFrameList.extend(frames)
+        if self._freedSinceDump is not None:
+            self._freedSinceDump.extend(frames)
+            self.__dropChangesIfTooMany()
 
     def adequateFrames(self,index):
         return len(self._freeFrameList) >= index
 
+    def isFree(self,frame):
+        return self._freeBitmap[frame] == 1
+
+    @property
+    def freeFrameCount(self):
+        return len(self._freeFrameList)
+
+    @property
+    def usedFrameCount(self):
+        return self._frameCount - len(self._freeFrameList)
+
+    @property
+    def frameCount(self):
+        return self._frameCount
+
     def putPageTable(self,pid,pageTable):
         self._pageTable[pid] = pageTable
 
     def getPageTable(self,pid):
         return self._pageTable[pid]
 
+    def removePageTable(self,pid):
+        del self._pageTable[pid]
+
+    ## the page tables are shared with the loader, it saves and restores them
+    def getState(self):
+        return {'frameSize': self._frameSize, 'frameCount': self._frameCount, 'freeFrames': list(self._freeFrameList)}
+
+    def setState(self, state):
+        if (state['frameSize'] != self._frameSize) or (state['frameCount'] != self._frameCount):
+            raise Exception("The checkpoint has {count} frames of {size}, this memory has {frames} of {frameSize}".format(count=state['frameCount'], size=state['frameSize'], frames=self._frameCount, frameSize=self._frameSize))
+        self._freeFrameList = list(state['freeFrames'])
+        self._freeBitmap = bytearray(self._frameCount)
+        for f in self._freeFrameList:
+            self._freeBitmap[f] = 1
+        self._pageTable = {}
+
     @property
     def frameSize(self):
         return self._frameSize
 
+    ## same as Memory.setIncrementalDump, for the free frame list
+    def setIncrementalDump(self, fullDumpEvery = None):
+        self._allocatedSinceDump = []
+        self._freedSinceDump = []
+        self._changesDropped = False
+        self._fullDumpEvery = fullDumpEvery
+        self._dumps = 0
+
+    ## if nobody dumps for long (ej: INFO is not logged) the changes are dropped and the next dump is whole
+    def __dropChangesIfTooMany(self):
+        if len(self._allocatedSinceDump) + len(self._freedSinceDump) > self._frameCount:
+            self._allocatedSinceDump = []
+            self._freedSinceDump = []
+            self._changesDropped = True
+
+    def dump(self):
+        if self._allocatedSinceDump is None:
+            return repr(self)
+        full = self._dumps == 0 or self._changesDropped or (self._fullDumpEvery is not None and self._dumps % self._fullDumpEvery == 0)
+        self._dumps += 1
+        self._changesDropped = False
+        allocated = self._allocatedSinceDump
+        freed = self._freedSinceDump
+        self._allocatedSinceDump = []
+        self._freedSinceDump = []
+        if full:
+            return repr(self)
+        return "frames taken: {allocated} freed: {freed} free: {free} of {count}".format(
+            allocated=allocated, freed=freed, free=self.freeFrameCount, count=self._frameCount)
+
     def __repr__(self):
-        return tabulate(enumerate(self._freeFrameList),tablefmt='psql')
+        return tabulate(enumerate(self._freeFrameList),tablefmt='psql', coltypes=[int, int])
 
 class Loader():
 
-    def __init__(self,memoryManager,fileSystem):
+    def __init__(self,memoryManager,fileSystem,useDMA = False):
         self._freeDir = 0
+        self._useDMA = useDMA
         self._fileSystem = fileSystem
         self._memoryManager = memoryManager
-
+        self._imageCache = ProgramImageCache(fileSystem, memoryManager.frameSize)
+        ## paginas de codigo compartidas: path -> {'pages', 'frames', 'pageTable', 'users', ...}
+        self._sharedPages = {}
+        ## pid -> entrada de _sharedPages que usa ese proceso
+        self._loadedPages = {}
+        ## id -> entrada cuyas paginas esta copiando el DMA (son los tags de sus transferencias)
+        self._transfersInFlight = {}
+
+    def pagesFor(self, path):
+        return self._imageCache.pageCountOf(path)
+
+    ## returns False (and loads nothing) if there are not enough free frames
+    @profiled("Loader.load")
     def load(self, pcb):
-        instructions = self._fileSystem.read(pcb.path).instructions
-        lenInstructions = len(instructions)
+        pages = self._imageCache.pagesFor(pcb.path)
+        shared = self._sharedPages.get(pcb.path)
+        if(shared == None or shared['pages'] is not pages):
+            shared = self.__loadPages(pages)
+            if(shared == None):
+                return False
+            ## si el programa se reescribio, los que usan la version vieja la siguen teniendo
+            self._sharedPages[pcb.path] = shared
+
+        shared['users'] += 1
+        self._loadedPages[pcb.pid] = shared
+        if(shared['pendingBlocks'] > 0):
+            shared['waiting'].append(pcb)
+        ## todos los procesos del mismo programa comparten la misma PageTable
+        self._memoryManager.putPageTable(pcb.pid,shared['pageTable'])
+        return True
+
+    ## frames are released only when the last process using them terminates
+    def unload(self, pcb):
+        shared = self._loadedPages.pop(pcb.pid)
+        self._memoryManager.removePageTable(pcb.pid)
+        shared['users'] -= 1
+        if(shared['users'] == 0):
+            self._memoryManager.freeFrame(shared['frames'])
+            if(self._sharedPages.get(pcb.path) is shared):
+                del self._sharedPages[pcb.path]
+
+    def isShared(self, path):
+        return path in self._sharedPages
+
+    def isLoaded(self, pcb):
+        return self._loadedPages[pcb.pid]['pendingBlocks'] == 0
+
+    ## True if the tag of a finished DMA transfer is a page copied by the loader
+    def ownsTransfer(self, tag):
+        return (tag is not None) and (self._transfersInFlight.get(id(tag)) is tag)
+
+    ## called when the DMA finishes a page, returns the pcbs whose program is now fully loaded
+    def blockTransferred(self, shared):
+        shared['pendingBlocks'] -= 1
+        if(shared['pendingBlocks'] > 0):
+            return []
+        del self._transfersInFlight[id(shared)]
+        loaded = shared['waiting']
+        shared['waiting'] = []
+        log.infoDump(HARDWARE.memory)
+        return loaded
+
+    def __loadPages(self, pages):
+        if(not self._memoryManager.adequateFrames(len(pages))):
+          return None
+
+        frames = self._memoryManager.allocFrame(len(pages))
         frameSize = self._memoryManager.frameSize
-        progPages = math.ceil(lenInstructions / frameSize)
-
-        if(self._memoryManager.adequateFrames(progPages)):
-          pageID = 0
-          frames = self._memoryManager.allocFrame(progPages)
-          pageTable = PageTable()
-          for frame in frames:
-              pageTable.putPageTable(pageID,frame)
-              pageID += 1
-          self._memoryManager.putPageTable(pcb.pid,pageTable)
-
-          numPage = 0
-          for frame in frames:
-            index = 0
-            while index < 4:
-             inst = instructions[numPage*frameSize + index]
-             HARDWARE.memory.put(frame*frameSize+index, inst)
-             index += 1
-             if(lenInstructions <=((numPage*frameSize)+index)):
-                 break
-            numPage += 1
-        log.logger.info(HARDWARE.memory)
+        shared = {'pages': pages, 'frames': frames, 'pageTable': PageTable(frames), 'users': 0, 'pendingBlocks': 0, 'waiting': []}
+        if(self._useDMA):
+            ## la copia la hace el DMA mientras el CPU sigue con otros procesos
+            shared['pendingBlocks'] = len(pages)
+            self._transfersInFlight[id(shared)] = shared
+            for frame, page in zip(frames, pages):
+                HARDWARE.dma.write(frame*frameSize, page, shared)
+        else:
+            for frame, page in zip(frames, pages):
+                HARDWARE.memory.putBlock(frame*frameSize, page)
+            log.infoDump(HARDWARE.memory)
+        return shared
+
+    ## the shared entries are saved once each and referenced by number (tagIndexes: id of each one -> its number,
+    ## for the DMA transfers); the pages of an entry are not saved if they are the cached image of the program
+    def getState(self, tagIndexes):
+        cacheState = self._imageCache.getState()
+        imagePaths = {id(pages): path for path, pages in cacheState['images'].items()}
+        entries = []
+        for shared in list(self._sharedPages.values()) + list(self._loadedPages.values()):
+            if id(shared) in tagIndexes:
+                continue
+            tagIndexes[id(shared)] = len(entries)
+            image = imagePaths.get(id(shared['pages']))
+            entries.append({'image': image, 'pages': shared['pages'] if image == None else None,
+                            'frames': list(shared['frames']), 'users': shared['users'],
+                            'pendingBlocks': shared['pendingBlocks'], 'waiting': [pcb.pid for pcb in shared['waiting']]})
+        return {'entries': entries, 'imageCache': cacheState,
+                'sharedPages': {path: tagIndexes[id(shared)] for path, shared in self._sharedPages.items()},
+                'loadedPages': {pid: tagIndexes[id(shared)] for pid, shared in self._loadedPages.items()}}
+
+    ## returns the shared entries by number (the tags of the DMA transfers)
+    def setState(self, state, pcbTable):
+        self._imageCache.setState(state['imageCache'])
+        entries = []
+        for entry in state['entries']:
+            pages = entry['pages']
+            if entry['image'] != None:
+                pages = self._imageCache.cachedPages(entry['image'])
+            frames = list(entry['frames'])
+            entries.append({'pages': pages, 'frames': frames, 'pageTable': PageTable(frames), 'users': entry['users'],
+                            'pendingBlocks': entry['pendingBlocks'], 'waiting': [pcbTable.getPid(pid) for pid in entry['waiting']]})
+        self._sharedPages = {path: entries[index] for path, index in state['sharedPages'].items()}
+        self._transfersInFlight = {id(shared): shared for shared in entries if shared['pendingBlocks'] > 0}
+        self._loadedPages = {}
+        for pid, index in state['loadedPages'].items():
+            self._loadedPages[pid] = entries[index]
+            self._memoryManager.putPageTable(pid, entries[index]['pageTable'])
+        return entries
 
+    @property
+    def imageCache(self):
+        return self._imageCache
+
+    @property
+    def useDMA(self):
+        return self._useDMA
 
     @property
     def freeDir(self):
         return self._freeDir
 
+## long-term scheduler: programs waiting for memory (state "new")
+class AdmissionQueue():
+
+    def __init__(self):
+        self._heap = []
+        self._count = 0
+
+    ## orden de admision, lo redefinen las subclases
+    def key(self, pcb, pages):
+        return 0
+
+    def add(self, pcb, pages):
+        ## el contador desempata en orden de llegada
+        heapq.heappush(self._heap, (self.key(pcb, pages), self._count, pcb))
+        self._count += 1
+
+    def admit(self, loader):
+        ## carga en orden a los que entran; el primero que no entra frena la admision
+        admitted = []
+        while (len(self._heap) > 0) and loader.load(self._heap[0][2]):
+            admitted.append(heapq.heappop(self._heap)[2])
+        return admitted
+
+    def isEmpty(self):
+        return len(self._heap) == 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    ## the heap is saved as it is, with the pcbs by pid
+    def getState(self):
+        return {'heap': [(key, count, pcb.pid) for key, count, pcb in self._heap], 'count': self._count}
+
+    def setState(self, state, pcbTable):
+        self._heap = [(key, count, pcbTable.getPid(pid)) for key, count, pid in state['heap']]
+        self._count = state['count']
+
+    def __repr__(self):
+        return "{name} waiting for memory: {pids}".format(name=self.__class__.__name__, pids=[entry[2].pid for entry in sorted(self._heap)])
+
+class FifoAdmission(AdmissionQueue):
+
+    def key(self, pcb, pages):
+        return 0
+
+class SmallestFirstAdmission(AdmissionQueue):
+
+    def key(self, pcb, pages):
+        return pages
+
+class PriorityAdmission(AdmissionQueue):
+
+    ## the programs run without priority are admitted like the lowest one (5, as in PrioritySchedule)
+    defaultPriority = 5
+
+    def key(self, pcb, pages):
+        if pcb.priority == None:
+            return self.defaultPriority
+        return pcb.priority
+
 class Scheduler():
 
     def __init__(self):
@@ -463,6 +1350,23 @@ class Scheduler():
     def isEmpty(self):
         pass
 
+    ## number of pcbs waiting in the ready queue
+    def __len__(self):
+        return len(self._readyQueue)
+
+    ## the ready queues, in the order they are saved in a checkpoint
+    def queues(self):
+        return [self._readyQueue]
+
+    ## the pids in each ready queue (the quantum is saved with the timer)
+    def getState(self):
+        return [[pcb.pid for pcb in queue.items()] for queue in self.queues()]
+
+    def setState(self, state, pcbTable):
+        for queue, pids in zip(self.queues(), state):
+            for pid in pids:
+                queue.enqueue(pcbTable.getPid(pid))
+
     @property
     def readyQueue(self):
         return self._readyQueue
@@ -540,6 +1444,12 @@ class PrioritySchedule(Scheduler):
                 return False
         return True
 
+    def __len__(self):
+        return len(self._priorit1) + len(self._priorit2) + len(self._priorit3) + len(self._priorit4) + len(self._priorit5)
+
+    def queues(self):
+        return [self._priorit1, self._priorit2, self._priorit3, self._priorit4, self._priorit5]
+
 
     def aging(self):
       '''if(not self._priorit2.isEmpty()):
@@ -560,10 +1470,18 @@ class PrioritySchedule(Scheduler):
              self._queues.get(i-1).enqueue(temp)
 
 
+## the gantt is stored as runs of states per pcb (one entry per state change),
+## the per-tick table is rebuilt only when it is asked for
 class GanttDiagram():
    
    def __init__(self,pcbTable):
-      self._table = {}
+      ## pid -> {'padding', 'addState', 'runs': [(sample, state)]}
+      self._rows = {}
+      self._firstRow = None
+      self._samples = 0
+      ## pids not terminated, and (sample, pid) of the terminations in order
+      self._live = set()
+      self._terminations = deque()
       self._pcbTable = pcbTable
       HARDWARE.clock.addSubscriber(self)
       
@@ -571,47 +1489,732 @@ class GanttDiagram():
    @property
    def pcbTable(self):
       return self._pcbTable 
-    
+
+   @property
+   def samples(self):
+      return self._samples
+
+   ## pid -> [state per tick], like the table that used to be stored
    @property
    def table(self):
-      return self._table
+      table = {}
+      for pid in self._rows:
+         table[pid] = self.rowOf(pid)
+      return table
+
+   ## every sample of the pcb, windowOf() gives only a part of them
+   def rowOf(self, pid):
+      row = self._rows[pid]
+      states = ['NotLoaded'] * row['padding']
+      states.append(row['addState'])
+      runs = row['runs']
+      for index in range(len(runs)):
+         start, state = runs[index]
+         if index + 1 < len(runs):
+            end = runs[index + 1][0]
+         else:
+            end = self._samples
+         states.extend([state] * (end - start))
+      return states
+
+   ## states of the samples fromSample..toSample-1, walking only the runs inside the window
+   def windowOf(self, pid, fromSample, toSample):
+      runs = self._rows[pid]['runs']
+      states = []
+      end = self._samples
+      index = len(runs) - 1
+      while index >= 0 and end > fromSample:
+         start, state = runs[index]
+         states.append((max(start, fromSample), min(end, toSample), state))
+         end = start
+         index -= 1
+      window = ['NotLoaded'] * (toSample - fromSample)
+      for start, stop, state in states:
+         for sample in range(start, stop):
+            window[sample - fromSample] = state
+      return window
+
+   ## pids that are alive or terminated since sinceSample (the older terminations are forgotten)
+   def activePids(self, sinceSample):
+      while len(self._terminations) > 0 and self._terminations[0][0] < sinceSample:
+         self._terminations.popleft()
+      pids = set(self._live)
+      for sample, pid in self._terminations:
+         pids.add(pid)
+      return sorted(pids)
+
+   ## (start tick, end tick, state) per state the pcb went through (end = None if still in it)
+   def intervalsOf(self, pid):
+      runs = self._rows[pid]['runs']
+      intervals = []
+      for index in range(len(runs)):
+         start, state = runs[index]
+         end = runs[index + 1][0] if index + 1 < len(runs) else None
+         if end != start:
+            intervals.append((start, end, state))
+      return intervals
    
    def addToTable(self, pcb):
-      state = pcb.state
-      if len(self._table) != 0:
-         self.table[pcb.pid] = ['NotLoaded']
-         for numberOfTicks in self._table[0]:
-            self.table[pcb.pid].append('NotLoaded')
-
-         self.table[pcb.pid].pop()
-         self.table[pcb.pid].append(state)
+      if self._firstRow == None:
+         self._firstRow = pcb.pid
+         padding = 0
       else:
-         self.table[pcb.pid] = [state]
+         ## the new row is padded up to the length of the first one
+         first = self._rows[self._firstRow]
+         padding = first['padding'] + 1 + self._samples - first['runs'][0][0]
+      self._rows[pcb.pid] = {'padding': padding, 'addState': pcb.state, 'runs': [(self._samples, pcb.state)]}
+      if pcb.state != "terminated":
+         self._live.add(pcb.pid)
+
+   ## called by the pcb (through the kernel) when its state changes
+   def stateChanged(self, pcb, oldState, newState):
+      row = self._rows.get(pcb.pid)
+      if row == None:
+         return
+      runs = row['runs']
+      ## varios cambios entre dos ticks: el tick solo ve el ultimo
+      if runs[-1][0] == self._samples:
+         runs.pop()
+      if len(runs) == 0 or runs[-1][1] != newState:
+         runs.append((self._samples, newState))
+      if newState == "terminated" and pcb.pid in self._live:
+         self._live.discard(pcb.pid)
+         self._terminations.append((self._samples, pcb.pid))
 
    def tick(self,tickNmbr):
-        for key, value in self._table.items():
-            state = self.pcbTable.getPid(key).state
-            value.append(state)
+        self._samples += 1
 
-        if self.pcbTable.allTerminated():
+        ## with deferred interrupts a #NEW can still be waiting in the interrupt vector
+        ## and with nothing run yet (ej: runAsync after switchOn) there is nothing to wait for
+        if len(self.pcbTable) > 0 and self.pcbTable.allTerminated() and HARDWARE.interruptVector.pendingCount == 0:
             log.logger.error('all terminated')
             HARDWARE.switchOff()
             log.logger.info(self)
 
    def __repr__(self):
-        return tabulate(self._table, tablefmt='fancy_grid')
+        return tabulate(self.table, tablefmt='fancy_grid', coltypes=str)
+
+## shows the last "window" ticks of the gantt of the active pcbs every "every" ticks
+## the cost of each refresh depends on the window, not on how long the simulation has been running
+class LiveGanttView():
+
+   def __init__(self, ganttDiagram, window = 20, every = 5, tablefmt = 'simple', output = None):
+      self._ganttDiagram = ganttDiagram
+      self._window = window
+      self._every = every
+      self._tablefmt = tablefmt
+      if output == None:
+         output = log.logger.info
+      self._output = output
+      HARDWARE.clock.addSubscriber(self)
 
-class PageTable():
+   def tick(self, tickNbr):
+      if self._ganttDiagram.samples % self._every == 0:
+         self._output(self.render())
+
+   def render(self):
+      toSample = self._ganttDiagram.samples
+      fromSample = max(0, toSample - self._window)
+      rows = []
+      for pid in self._ganttDiagram.activePids(fromSample):
+         rows.append([pid] + self._ganttDiagram.windowOf(pid, fromSample, toSample))
+      return tabulate(rows, headers=["pid"] + list(range(fromSample, toSample)), tablefmt=self._tablefmt)
+
+## streams the state changes of the pcbs while the simulation runs:
+## jsonPath: Chrome trace events (open it in Perfetto / chrome://tracing), one slice per state
+## csvPath: one line per change (tick,pid,path,oldState,newState)
+## at most bufferSize lines are kept in memory before writing them
+class GanttExporter():
+
+    def __init__(self, jsonPath = None, csvPath = None, bufferSize = 1000, tickMicroseconds = 1000):
+        self._bufferSize = bufferSize
+        self._tickMicroseconds = tickMicroseconds
+        self._jsonFile = None
+        self._csvFile = None
+        self._csvWriter = None
+        self._jsonBuffer = []
+        self._csvBuffer = []
+        self._firstEvent = True
+        ## pid -> (start tick, state) of the state each pcb is in
+        self._openStates = {}
+        if jsonPath != None:
+            self._jsonFile = open(jsonPath, "w")
+            self._jsonFile.write("[\n")
+        if csvPath != None:
+            ## csv.writer quotes the paths with "," or quotes
+            self._csvFile = open(csvPath, "w", newline="")
+            self._csvWriter = csv.writer(self._csvFile, lineterminator="\n")
+            self._csvWriter.writerow(["tick", "pid", "path", "oldState", "newState"])
+        HARDWARE.addSwitchOffSubscriber(self)
+
+    def stateChanged(self, pcb, oldState, newState):
+        tick = HARDWARE.clock.currentTick
+        if self._csvFile != None:
+            self._csvBuffer.append((tick, pcb.pid, pcb.path, oldState, newState))
+            if len(self._csvBuffer) >= self._bufferSize:
+                self.__flushCsv()
+        if self._jsonFile != None:
+            opened = self._openStates.get(pcb.pid)
+            if opened == None:
+                self.__addEvent({"name": "thread_name", "ph": "M", "pid": 1, "tid": pcb.pid, "args": {"name": "pid {pid} {path}".format(pid=pcb.pid, path=pcb.path)}})
+                opened = (pcb.creationTick, oldState)
+            self.__closeState(pcb.pid, opened, tick)
+            if newState == "terminated":
+                self._openStates.pop(pcb.pid, None)
+                self.__addEvent({"name": "terminated", "ph": "i", "s": "t", "pid": 1, "tid": pcb.pid, "ts": tick * self._tickMicroseconds})
+            else:
+                self._openStates[pcb.pid] = (tick, newState)
+
+    def __closeState(self, pid, opened, tick):
+        start, state = opened
+        if tick > start:
+            self.__addEvent({"name": state, "cat": "state", "ph": "X", "pid": 1, "tid": pid, "ts": start * self._tickMicroseconds, "dur": (tick - start) * self._tickMicroseconds})
+
+    def __addEvent(self, event):
+        self._jsonBuffer.append(("" if self._firstEvent else ",\n") + json.dumps(event))
+        self._firstEvent = False
+        if len(self._jsonBuffer) >= self._bufferSize:
+            self.__flushJson()
+
+    def __flushJson(self):
+        self._jsonFile.write("".join(self._jsonBuffer))
+        self._jsonBuffer = []
+
+    def __flushCsv(self):
+        self._csvWriter.writerows(self._csvBuffer)
+        self._csvBuffer = []
+
+    def switchedOff(self):
+        self.close()
+
+    ## writes what is left (closing the states still open) and closes the files
+    def close(self):
+        if self._jsonFile != None and not self._jsonFile.closed:
+            tick = HARDWARE.clock.currentTick
+            for pid, opened in self._openStates.items():
+                self.__closeState(pid, opened, tick)
+            self._openStates = {}
+            self.__flushJson()
+            self._jsonFile.write("\n]\n")
+            self._jsonFile.close()
+        if self._csvFile != None and not self._csvFile.closed:
+            self.__flushCsv()
+            self._csvFile.close()
+
+## metrics in the Prometheus text format, read when they are collected
+## (nothing is updated on the simulation path and the interrupt lock is never taken)
+class MetricsRegistry():
 
     def __init__(self):
-        self._pageTable = {}
+        self._metrics = []
+
+    ## collect() returns the value, or a list of ({label: value}, value) samples
+    def register(self, name, metricType, help, collect):
+        self._metrics.append((name, metricType, help, collect))
+
+    def render(self):
+        lines = []
+        for name, metricType, help, collect in self._metrics:
+            lines.append("# HELP {name} {help}".format(name=name, help=help))
+            lines.append("# TYPE {name} {type}".format(name=name, type=metricType))
+            samples = collect()
+            if not isinstance(samples, list):
+                samples = [({}, samples)]
+            for labels, value in samples:
+                lines.append("{name}{labels} {value}".format(name=name, labels=self.__labels(labels), value=value))
+        return "\n".join(lines) + "\n"
+
+    def __labels(self, labels):
+        if len(labels) == 0:
+            return ""
+        pairs = []
+        for key, value in sorted(labels.items()):
+            value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            pairs.append('{key}="{value}"'.format(key=key, value=value))
+        return "{" + ",".join(pairs) + "}"
+
+    def __repr__(self):
+        return self.render()
+
+## the metrics of the kernel and the hardware it runs on
+class KernelMetrics(MetricsRegistry):
+
+    def __init__(self, kernel):
+        super().__init__()
+        self._kernel = kernel
+        self.register("os_clock_tick", "gauge", "Number of the last clock tick.",
+                      lambda: HARDWARE.clock.currentTick)
+        self.register("os_irqs_total", "counter", "Interrupts handled, by type.",
+                      lambda: [({'type': irqType}, stats[0]) for irqType, stats in sorted(HARDWARE.interruptVector.handlerStats().items())])
+        self.register("os_ready_queue_depth", "gauge", "Pcbs waiting in the ready queue.",
+                      lambda: len(kernel.scheduler))
+        self.register("os_running_pid", "gauge", "Pid of the running pcb, -1 if the cpu is idle.",
+                      self.__runningPID)
+        self.register("os_free_frames", "gauge", "Free memory frames.",
+                      lambda: kernel.memoryManager.freeFrameCount)
+        self.register("os_frames", "gauge", "Memory frames.",
+                      lambda: kernel.memoryManager.frameCount)
+        self.register("os_device_busy_channels", "gauge", "Channels running an operation, by device.",
+                      lambda: [({'device': device.deviceId}, device.activeChannels) for device in list(HARDWARE.ioDevices.values())])
+        self.register("os_device_operations_total", "counter", "Operations completed, by device.",
+                      lambda: [({'device': device.deviceId}, device.completedOperations) for device in list(HARDWARE.ioDevices.values())])
+        self.register("os_context_switches_total", "counter", "Pcbs loaded into the cpu by the dispatcher.",
+                      lambda: kernel.dispatcher.contextSwitches)
+        self.register("os_page_faults_total", "counter", "Fetches of pages that are not in the MMU.",
+                      lambda: HARDWARE.mmu.pageFaults)
+
+    def __runningPID(self):
+        runningPCB = self._kernel.pcbTable.runningPCB
+        if runningPCB == None:
+            return -1
+        return runningPCB.pid
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.logger.debug("metrics - " + format % args)
+
+## serves a registry on http://127.0.0.1:port/metrics (port 0 picks a free one) and/or
+## writes it to "path" every "every" ticks, replacing the file so readers never see half of it
+class MetricsExporter():
+
+    def __init__(self, registry, port = None, path = None, every = 100):
+        self._registry = registry
+        self._path = path
+        self._every = every
+        self._server = None
+        if port != None:
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+            self._server.registry = registry
+            Thread(target=self._server.serve_forever, daemon=True).start()
+        if path != None:
+            HARDWARE.clock.addSubscriber(self)
+        HARDWARE.addSwitchOffSubscriber(self)
 
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def tick(self, tickNbr):
+        if tickNbr % self._every == 0:
+            self.write()
+
+    def write(self):
+        temporaryPath = self._path + ".tmp"
+        with open(temporaryPath, "w") as metricsFile:
+            metricsFile.write(self._registry.render())
+        os.replace(temporaryPath, self._path)
+
+    def switchedOff(self):
+        if self._path != None:
+            self.write()
+        if self._server != None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+## kinds of the records of a recording
+RECORD_END = 0
+RECORD_STRING = 1
+RECORD_WRITE = 2
+RECORD_SYSCALL = 3
+RECORD_COMPLETION = 4
+RECORD_SWAP = 5
+
+## records to a compact binary file what is injected into a run (the programs written and the
+## "system calls", with the point of the tick they happened at) and what the kernel did with them
+## (device completions and context switches, with the tick they happened in), for the Replayer.
+## every record is its kind and varints: the tick as a zigzag delta of the previous one, then its data;
+## paths and instructions are written once as RECORD_STRING and then referenced by number.
+## the point of the tick is the clock phase (see Clock.phase), so an event that happened in the middle of a tick
+## (ej: a #NEW queued with deferred irqs, handled at the end of that tick) is replayed at the same point
+## (create it right after the kernel, so it sees every program written)
+class Recorder():
+
+    MAGIC = b"OSRP"
+    VERSION = 2
+
+    def __init__(self, kernel, path, bufferSize = 65536):
+        self._kernel = kernel
+        self._file = open(path, "wb")
+        self._buffer = bytearray(self.MAGIC)
+        self._buffer.append(self.VERSION)
+        self._bufferSize = bufferSize
+        self._strings = {}
+        self._lastTick = 0
+        ## syscalls come from the main thread, the rest from the clock thread
+        self._lock = Lock()
+        kernel.recorder = self
+        kernel.addStateListener(self)
+        kernel.fileSystem.addSubscriber(self)
+        HARDWARE.addSwitchOffSubscriber(self)
+
+    ## (tick, point) an injected event must be replayed at: (next tick, 0) between ticks (before the clock
+    ## moves to the next tick), (tick, phase + 1) in the middle of one (before that subscriber ticks)
+    def __injectionPoint(self):
+        clock = HARDWARE.clock
+        phase = clock.phase
+        if phase == None:
+            return clock.nextTick, 0
+        return clock.currentTick, phase + 1
+
+    def written(self, path):
+        program = self._kernel.fileSystem.read(path)
+        with self._lock:
+            tickNbr, phase = self.__injectionPoint()
+            data = [phase, self.__string(path), self.__string(program.name), len(program.instructions)]
+            data.extend(self.__string(instruction) for instruction in program.instructions)
+            self.__record(RECORD_WRITE, tickNbr, data)
+
+    ## the priority may be None or negative
+    def syscall(self, path, priority):
+        if (priority != None) and not isinstance(priority, int):
+            raise Exception("Can't record the priority {priority} of {path}".format(priority=priority, path=path))
+        with self._lock:
+            tickNbr, phase = self.__injectionPoint()
+            ## 0 is None, the rest is the zigzag of the priority + 1
+            encodedPriority = 0 if priority == None else zigzag(priority) + 1
+            self.__record(RECORD_SYSCALL, tickNbr, [phase, self.__string(path), encodedPriority])
+
+    def stateChanged(self, pcb, oldState, newState):
+        with self._lock:
+            if oldState == "waiting":
+                self.__record(RECORD_COMPLETION, HARDWARE.clock.currentTick, [pcb.pid])
+            if newState == "running":
+                self.__record(RECORD_SWAP, HARDWARE.clock.currentTick, [pcb.pid])
+
+    def switchedOff(self):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._file == None:
+                return
+            self.__record(RECORD_END, HARDWARE.clock.currentTick, [])
+            self._file.write(self._buffer)
+            self._file.close()
+            self._file = None
+
+    def __string(self, text):
+        number = self._strings.get(text)
+        if number == None:
+            number = len(self._strings)
+            self._strings[text] = number
+            encoded = text.encode("utf-8")
+            self._buffer.append(RECORD_STRING)
+            writeVarint(self._buffer, len(encoded))
+            self._buffer.extend(encoded)
+        return number
+
+    def __record(self, kind, tickNbr, data):
+        if self._file == None:
+            return
+        self._buffer.append(kind)
+        writeVarint(self._buffer, zigzag(tickNbr - self._lastTick))
+        self._lastTick = tickNbr
+        for value in data:
+            writeVarint(self._buffer, value)
+        if len(self._buffer) >= self._bufferSize:
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+
+## the varints are unsigned, zigzag maps 0, -1, 1, -2... to 0, 1, 2, 3...
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(value):
+    return (value >> 1) if value % 2 == 0 else -((value + 1) >> 1)
+
+def writeVarint(buffer, value):
+    if value < 0:
+        raise Exception("A varint can't be negative: {value}".format(value=value))
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def readVarint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+## replays a recording on a kernel setup like the recorded one (same hardware, scheduler and options),
+## in virtual time: the replayer notifies the ticks itself, back to back, and the clock must not be switched on.
+## the programs and system calls are injected at the point of the tick they were recorded at (the clock must
+## have the same subscribers, in the same order), and every completion and context switch is checked
+## against the recorded one: divergence says where the runs first differ
+class Replayer():
+
+    def __init__(self, kernel, path):
+        self._kernel = kernel
+        self._injected = deque()
+        self._expected = []
+        self._endTick = None
+        self.__read(path)
+        self._checked = 0
+        self._divergence = None
+        self._switchedOff = False
+        kernel.addStateListener(self)
+        HARDWARE.addSwitchOffSubscriber(self)
+
+    @property
+    def divergence(self):
+        return self._divergence
+
+    @property
+    def checkedEvents(self):
+        return self._checked
+
+    ## runs until the recorded end (or until the hardware is switched off), True if nothing diverged
+    def run(self):
+        tickNbr = 0
+        while (not self._switchedOff) and (tickNbr <= self._endTick):
+            self.__injectUpTo(tickNbr, -1)
+            HARDWARE.clock.notify(tickNbr, self.__injectUpTo)
+            tickNbr += 1
+        if (self._divergence == None) and (self._checked < len(self._expected)):
+            kind, expectedTick, pid = self._expected[self._checked]
+            self.__diverged("the replay ended before the {kind} of pid {pid} at tick {tick}".format(kind=kind, pid=pid, tick=expectedTick))
+        return self._divergence == None
+
+    def stateChanged(self, pcb, oldState, newState):
+        if oldState == "waiting":
+            self.__check("completion", pcb.pid)
+        if newState == "running":
+            self.__check("swap", pcb.pid)
+
+    def switchedOff(self):
+        self._switchedOff = True
+
+    def __check(self, kind, pid):
+        if self._divergence != None:
+            return
+        tickNbr = HARDWARE.clock.currentTick
+        if self._checked >= len(self._expected):
+            self.__diverged("tick {tick}: unexpected {kind} of pid {pid}".format(tick=tickNbr, kind=kind, pid=pid))
+            return
+        expected = self._expected[self._checked]
+        if expected != (kind, tickNbr, pid):
+            self.__diverged("tick {tick}: {kind} of pid {pid}, the recording has the {expectedKind} of pid {expectedPid} at tick {expectedTick}".format(
+                tick=tickNbr, kind=kind, pid=pid, expectedKind=expected[0], expectedPid=expected[2], expectedTick=expected[1]))
+            return
+        self._checked += 1
+
+    def __diverged(self, message):
+        self._divergence = message
+        log.logger.error("replay diverged: " + message)
+
+    ## injects the events recorded up to this phase of the tick (-1: before the tick, see Recorder.__injectionPoint)
+    def __injectUpTo(self, tickNbr, phase):
+        while (len(self._injected) > 0) and (self._injected[0][:2] <= (tickNbr, phase + 1)):
+            self.__inject(self._injected.popleft())
+
+    def __inject(self, event):
+        tickNbr, phase, kind, data = event
+        if kind == RECORD_WRITE:
+            path, name, instructions = data
+            self._kernel.fileSystem.write(path, Program(name, instructions))
+        else:
+            path, priority = data
+            self._kernel.run(path, priority)
+
+    def __read(self, path):
+        with open(path, "rb") as recording:
+            data = recording.read()
+        if data[:len(Recorder.MAGIC)] != Recorder.MAGIC:
+            raise Exception("{path} is not a recording".format(path=path))
+        if data[len(Recorder.MAGIC)] != Recorder.VERSION:
+            raise Exception("Unsupported recording version {version}".format(version=data[len(Recorder.MAGIC)]))
+        position = len(Recorder.MAGIC) + 1
+        strings = []
+        tickNbr = 0
+        while position < len(data):
+            kind = data[position]
+            position += 1
+            if kind == RECORD_STRING:
+                length, position = readVarint(data, position)
+                strings.append(data[position:position + length].decode("utf-8"))
+                position += length
+                continue
+            delta, position = readVarint(data, position)
+            tickNbr += unzigzag(delta)
+            if kind == RECORD_END:
+                self._endTick = tickNbr
+            elif kind == RECORD_WRITE:
+                phase, position = readVarint(data, position)
+                pathNbr, position = readVarint(data, position)
+                nameNbr, position = readVarint(data, position)
+                count, position = readVarint(data, position)
+                instructions = []
+                for i in range(count):
+                    instructionNbr, position = readVarint(data, position)
+                    instructions.append(strings[instructionNbr])
+                self._injected.append((tickNbr, phase, kind, (strings[pathNbr], strings[nameNbr], instructions)))
+            elif kind == RECORD_SYSCALL:
+                phase, position = readVarint(data, position)
+                pathNbr, position = readVarint(data, position)
+                priority, position = readVarint(data, position)
+                priority = None if priority == 0 else unzigzag(priority - 1)
+                self._injected.append((tickNbr, phase, kind, (strings[pathNbr], priority)))
+            elif kind in [RECORD_COMPLETION, RECORD_SWAP]:
+                pid, position = readVarint(data, position)
+                self._expected.append(("completion" if kind == RECORD_COMPLETION else "swap", tickNbr, pid))
+            else:
+                raise Exception("Unknown record kind {kind} in {path}".format(kind=kind, path=path))
+        if self._endTick == None:
+            ## the recording was not closed: replay up to its last event
+            self._endTick = tickNbr
+
+
+## saves the whole machine (memory, mmu, cpu, timer, dma, devices and the kernel) to a checkpoint file,
+## and restores it on a machine setup the same way (hardware, devices, scheduler and options) before switching it on.
+## the file is MAGIC, the format version and the zlib compressed pickle of the plain state of every
+## component (the pcbs by pid), so only restore checkpoints you trust.
+## with "every", a checkpoint is taken at the end of every "every" ticks: the clock only waits while the
+## state is copied, the pickle, the compression and the write are done by another thread
+class Checkpointer():
+
+    MAGIC = b"OSCK"
+    VERSION = 1
+
+    def __init__(self, kernel, path, every = None):
+        self._kernel = kernel
+        self._path = path
+        self._every = every
+        self._writer = None
+        self._taken = 0
+        self._skipped = 0
+        if every != None:
+            HARDWARE.clock.addTickEndSubscriber(self)
+            HARDWARE.addSwitchOffSubscriber(self)
+
+    @property
+    def taken(self):
+        return self._taken
+
+    ## the periodic checkpoints not taken (the previous one was still being written or the state can't be saved)
+    @property
+    def skipped(self):
+        return self._skipped
+
+    ## plain copy of the state, nothing in it is shared with the running machine
+    def capture(self):
+        interruptVector = HARDWARE.interruptVector
+        ## with the irqs handled inline, no handler (ej: a #NEW from kernel.run) is left half done
+        locked = not interruptVector.deferred
+        if locked:
+            interruptVector.lock.acquire()
+        try:
+            tagIndexes = dict()
+            kernelState = self._kernel.getState(tagIndexes)
+            return {'kernel': kernelState, 'hardware': HARDWARE.getState(tagIndexes)}
+        finally:
+            if locked:
+                interruptVector.lock.release()
+
+    ## takes a checkpoint now and waits until it is written
+    def save(self, path = None):
+        if path == None:
+            path = self._path
+        self.__write(self.capture(), path)
+
+    def tickEnded(self, tickNbr):
+        if (tickNbr + 1) % self._every != 0:
+            return
+        if (self._writer != None) and self._writer.is_alive():
+            ## the clock doesn't wait for the previous write, this checkpoint is skipped
+            self._skipped += 1
+            log.logger.warning("checkpoint skipped at tick {tick}: the previous one is still being written".format(tick=tickNbr))
+            return
+        try:
+            state = self.capture()
+        except Exception as e:
+            self._skipped += 1
+            log.logger.warning("checkpoint skipped at tick {tick}: {error}".format(tick=tickNbr, error=e))
+            return
+        self._writer = Thread(target=self.__write, args=(state, self._path))
+        self._writer.start()
+
+    def switchedOff(self):
+        if self._writer != None:
+            self._writer.join()
+
+    ## the file is replaced only when the new checkpoint is complete
+    ## (zlib level 1: several times faster than the default for a few % more bytes)
+    def __write(self, state, path):
+        data = self.MAGIC + bytes([self.VERSION]) + zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        temporaryPath = path + ".tmp"
+        with open(temporaryPath, "wb") as checkpointFile:
+            checkpointFile.write(data)
+        os.replace(temporaryPath, path)
+        self._taken += 1
+        log.logger.info("checkpoint at tick {tick} written to {path} ({size} bytes)".format(tick=state['hardware']['clock']['currentTick'], path=path, size=len(data)))
+
+    ## the state saved in the checkpoint file
+    def read(self, path = None):
+        if path == None:
+            path = self._path
+        with open(path, "rb") as checkpointFile:
+            data = checkpointFile.read()
+        if data[:len(self.MAGIC)] != self.MAGIC:
+            raise Exception("{path} is not a checkpoint".format(path=path))
+        if data[len(self.MAGIC)] != self.VERSION:
+            raise Exception("Unsupported checkpoint version {version}".format(version=data[len(self.MAGIC)]))
+        return pickle.loads(zlib.decompress(data[len(self.MAGIC) + 1:]))
+
+    ## the kernel must be new and the hardware switched off, the clock goes on from the tick after the checkpoint
+    def restore(self, path = None):
+        state = self.read(path)
+        if HARDWARE.clock.isRunning:
+            raise Exception("The hardware must be switched off to restore a checkpoint")
+        tags = self._kernel.setState(state['kernel'])
+        HARDWARE.setState(state['hardware'], tags)
+        log.logger.info("restored the checkpoint of tick {tick}".format(tick=state['hardware']['clock']['currentTick']))
+
+
+## the pages of a process are 0..n-1, so a list indexed by page is enough
+class PageTable():
+
+    __slots__ = ('_frames',)
+
+    def __init__(self, frames = None):
+        if frames == None:
+            frames = []
+        self._frames = frames
+
+    ## page -> frame (as a dict, like before)
     @property
     def pageTable(self):
-        return self._pageTable
+        return dict(enumerate(self._frames))
+
+    @property
+    def frames(self):
+        return self._frames
+
+    def items(self):
+        return enumerate(self._frames)
 
     def putPageTable(self,numPage,numFrame):
-        self._pageTable[numPage]=numFrame
+        if numPage >= len(self._frames):
+            self._frames.extend([None] * (numPage + 1 - len(self._frames)))
+        self._frames[numPage]=numFrame
 
 class PreemptivePriority(PrioritySchedule):
 
@@ -650,7 +2253,7 @@ class NoPreemptivePriority(PrioritySchedule):
 # emulates the core of an Operative System
 class Kernel():
 
-    def __init__(self, scheduler):
+    def __init__(self, scheduler, admissionQueue = None, useDMA = False):
 
         ## setup interruption handlers
         killHandler = KillInterruptionHandler(self)
@@ -668,6 +2271,9 @@ class Kernel():
         timeOutHandler = TimeoutInterruptionHandler(self)
         HARDWARE.interruptVector.register(TIMEOUT_INTERRUPTION_TYPE,timeOutHandler)
 
+        dmaHandler = DmaInterruptionHandler(self)
+        HARDWARE.interruptVector.register(DMA_INTERRUPTION_TYPE,dmaHandler)
+
         #create a PCBTable
         self._pcbTable = PCBTable()
 
@@ -680,22 +2286,69 @@ class Kernel():
         #create a Dispatcher
         self._dispatcher = Dispatcher()
 
-        ## controls the Hardware's I/O Device
+        ## controls the Hardware's I/O Devices (one controller per device)
         self._ioDeviceController = IoDeviceController(HARDWARE.ioDevice)
+        self._ioDeviceControllers = {HARDWARE.ioDevice.deviceId: self._ioDeviceController}
 
         #create a MemoryManager
         self._memoryManager = MemoryManager(4)
 
         # create a Loader
-        self._loader = Loader(self._memoryManager,self._fileSystem)
+        self._loader = Loader(self._memoryManager,self._fileSystem,useDMA)
+
+        # create the admission queue (long-term scheduler)
+        if (admissionQueue == None):
+            admissionQueue = FifoAdmission()
+        self._admissionQueue = admissionQueue
 
         # create gantt diagram
         self._ganttDiagram = GanttDiagram(self._pcbTable)
 
+        # other objects that want to know the state changes of the pcbs (ej: GanttExporter)
+        self._stateListeners = []
+        self._recorder = None
+
+        # told transferred(tag, data) when a DMA transfer that is not a page of the loader finishes
+        self._dmaListeners = []
+
+        # turnaround / waiting / response time of the processes
+        self._schedulingMetrics = SchedulingMetrics()
+        self.addStateListener(self._schedulingMetrics)
+
     @property
     def ioDeviceController(self):
         return self._ioDeviceController
 
+    ## None means the default device; controllers for devices added later are created on demand
+    def ioDeviceControllerFor(self, deviceId):
+        if (deviceId == None):
+            return self._ioDeviceController
+        controller = self._ioDeviceControllers.get(deviceId)
+        if (controller == None):
+            controller = IoDeviceController(HARDWARE.getIODevice(deviceId))
+            self._ioDeviceControllers[deviceId] = controller
+        return controller
+
+    @property
+    def ioDeviceControllers(self):
+        return self._ioDeviceControllers
+
+    ## utilization, queue and wait/service times per device, marking the bottleneck
+    def ioReport(self):
+        controllers = list(self._ioDeviceControllers.values())
+        ## the bottleneck is the most used device (on a tie, the one with the longest waits)
+        bottleneck = max(controllers, key=lambda c: (c.device.utilization, c.averageWait))
+        rows = []
+        for controller in controllers:
+            device = controller.device
+            rows.append([device.deviceId, device.busyTicks, device.idleTicks, "{:.1%}".format(device.utilization),
+                         "{:.2f}".format(controller.averageQueueLength), controller.maxQueueLength, controller.waitTimes.count,
+                         "{:.2f}".format(controller.waitTimes.mean), controller.waitTimes.percentile(95),
+                         "{:.2f}".format(controller.serviceTimes.mean), controller.serviceTimes.percentile(95),
+                         "<< bottleneck" if controller is bottleneck else ""])
+        return tabulate(rows, headers=["device", "busy", "idle", "util", "avg queue", "max queue", "requests",
+                                       "avg wait", "p95 wait", "avg service", "p95 service", ""], tablefmt='psql')
+
     @property
     def memoryManager(self):
         return self._memoryManager
@@ -712,6 +2365,10 @@ class Kernel():
     def loader(self):
         return self._loader
 
+    @property
+    def admissionQueue(self):
+        return self._admissionQueue
+
     @property
     def scheduler(self):
         return self._scheduler
@@ -724,15 +2381,98 @@ class Kernel():
     def ganttDiagram(self):
         return self._ganttDiagram
 
+    ## the system calls are given to the recorder, if any (see Recorder)
+    @property
+    def recorder(self):
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        self._recorder = recorder
+
+    @property
+    def schedulingMetrics(self):
+        return self._schedulingMetrics
+
     ## emulates a "system call" for programs execution
     def run(self, path, priority):
 
+        if self._recorder != None:
+            self._recorder.syscall(path, priority)
         newProgram = {'path':path,'priority':priority}
-        newIRQ = IRQ(NEW_INTERRUPTION_TYPE, newProgram)
+        newIRQ = IRQ.create(NEW_INTERRUPTION_TYPE, newProgram)
         HARDWARE.interruptVector.handle(newIRQ)
         log.logger.info("\n Executing program: {name}".format(name=path))
-        log.logger.info(HARDWARE)
+        log.infoDump(HARDWARE)
+
+    ## "system call" for the asyncio backend: runs the program and waits until it terminates
+    ## (raises CancelledError if the hardware is switched off first)
+    async def runAsync(self, path, priority):
+        lastPID = self._pcbTable.lastPID
+        self.run(path, priority)
+        if (self._pcbTable.lastPID == lastPID):
+            ## the program was rejected
+            return None
+        pcb = self._pcbTable.getPid(self._pcbTable.lastPID)
+        while (pcb.state != "terminated"):
+            await HARDWARE.clock.ticks(1)
+        return pcb
+
+
+    ## every pcb tells the kernel when its state changes
+    def stateChanged(self, pcb, oldState, newState):
+        self._ganttDiagram.stateChanged(pcb, oldState, newState)
+        for listener in self._stateListeners:
+            listener.stateChanged(pcb, oldState, newState)
+
+    def addStateListener(self, listener):
+        self._stateListeners.append(listener)
+
+    def addDmaListener(self, listener):
+        self._dmaListeners.append(listener)
 
+    @property
+    def dmaListeners(self):
+        return self._dmaListeners
+
+    ## memory and free frame logs only show what changed since the previous log,
+    ## with a full dump every "fullDumpEvery" logs (the memory is tracked per frame)
+    def setIncrementalDumps(self, fullDumpEvery = None):
+        HARDWARE.memory.setIncrementalDump(fullDumpEvery, self._memoryManager.frameSize)
+        self._memoryManager.setIncrementalDump(fullDumpEvery)
+
+    ## plain copy of the kernel state for a checkpoint (see Checkpointer),
+    ## the statistics (gantt history, metrics, histograms) are not saved
+    def getState(self, tagIndexes):
+        controllers = dict()
+        for deviceId, controller in self._ioDeviceControllers.items():
+            controllers[deviceId] = controller.getState()
+        return {'scheduler': self._scheduler.__class__.__name__, 'admissionQueue': self._admissionQueue.__class__.__name__,
+                'useDMA': self._loader.useDMA, 'fileSystem': self._fileSystem.getState(), 'pcbTable': self._pcbTable.getState(),
+                'readyQueues': self._scheduler.getState(), 'admission': self._admissionQueue.getState(),
+                'memoryManager': self._memoryManager.getState(), 'loader': self._loader.getState(tagIndexes),
+                'ioDeviceControllers': controllers}
+
+    ## the kernel must be new and created like the checkpointed one (same scheduler, admission queue and options),
+    ## returns the loader entries by number (the tags of the DMA transfers)
+    def setState(self, state):
+        for name, current in [('scheduler', self._scheduler), ('admissionQueue', self._admissionQueue)]:
+            if state[name] != current.__class__.__name__:
+                raise Exception("The kernel uses {current}, the checkpoint was taken with {saved}".format(current=current.__class__.__name__, saved=state[name]))
+        if state['useDMA'] != self._loader.useDMA:
+            raise Exception("The checkpoint was taken with useDMA = {saved}".format(saved=state['useDMA']))
+        self._fileSystem.setState(state['fileSystem'])
+        self._pcbTable.setState(state['pcbTable'], self)
+        self._scheduler.setState(state['readyQueues'], self._pcbTable)
+        self._admissionQueue.setState(state['admission'], self._pcbTable)
+        self._memoryManager.setState(state['memoryManager'])
+        tags = self._loader.setState(state['loader'], self._pcbTable)
+        for deviceId, controllerState in state['ioDeviceControllers'].items():
+            self.ioDeviceControllerFor(deviceId).setState(controllerState, self._pcbTable)
+        ## the gantt starts again from the restored tick
+        for pcbState in state['pcbTable']['pcbs']:
+            self._ganttDiagram.addToTable(self._pcbTable.getPid(pcbState['_pid']))
+        return tags
 
     def __repr__(self):
         return "Kernel "
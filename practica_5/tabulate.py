@@ -6,6 +6,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from collections import namedtuple, Iterable
 from platform import python_version_tuple
+from itertools import islice
 import re
 import math
 
@@ -46,7 +47,7 @@ except ImportError:
     wcwidth = None
 
 
-__all__ = ["tabulate", "tabulate_formats", "simple_separated_format"]
+__all__ = ["tabulate", "tabulate_lines", "tabulate_formats", "simple_separated_format"]
 __version__ = "0.8.2"
 
 
@@ -958,7 +959,8 @@ def _normalize_tabular_data(tabular_data, headers, showindex="default"):
 
 def tabulate(tabular_data, headers=(), tablefmt="simple",
              floatfmt=_DEFAULT_FLOATFMT, numalign="decimal", stralign="left",
-             missingval=_DEFAULT_MISSINGVAL, showindex="default", disable_numparse=False):
+             missingval=_DEFAULT_MISSINGVAL, showindex="default", disable_numparse=False,
+             coltypes=None):
     """Format a fixed width table for pretty printing.
 
     >>> print(tabulate([[1, 2.34], [-56, "8.999"], ["2", "10001"]]))
@@ -1240,6 +1242,22 @@ def tabulate(tabular_data, headers=(), tablefmt="simple",
     indices is used to disable number parsing only on those columns
     e.g. `disable_numparse=[0, 2]` would disable number parsing only on the
     first and third columns.
+
+    Declared column types
+    ---------------------
+    Large tables of known content can skip type inference by passing
+    `coltypes`, a list with one of `int`, `float` or `str` per column
+    (or a single type for all the columns; missing entries are `str`).
+    Cells are then formatted by their declared type without number
+    parsing, ANSI codes and multiline cells are not looked for, widths
+    are computed in one pass per column and rows are formatted with a
+    single template. "decimal" alignment falls back to right alignment.
+
+    >>> print(tabulate([[1, "spam"], [20, "eggs"]], coltypes=[int, str]))
+    --  ----
+     1  spam
+    20  eggs
+    --  ----
     """
     if tabular_data is None:
         tabular_data = []
@@ -1251,6 +1269,10 @@ def tabulate(tabular_data, headers=(), tablefmt="simple",
     if tablefmt == 'rst':
         list_of_lists, headers = _rst_escape_first_column(list_of_lists, headers)
 
+    if coltypes is not None:
+        return _tabulate_typed(list_of_lists, headers, tablefmt, coltypes,
+                               floatfmt, numalign, stralign, missingval)
+
     # optimization: look for ANSI control codes once,
     # enable smart width functions only if a control code is found
     plain_text = '\t'.join(['\t'.join(map(_text_type, headers))] + \
@@ -1309,6 +1331,256 @@ def tabulate(tabular_data, headers=(), tablefmt="simple",
     return _format_table(tablefmt, headers, rows, minwidths, aligns, is_multiline)
 
 
+def _tabulate_typed(list_of_lists, headers, tablefmt, coltypes,
+                    floatfmt, numalign, stralign, missingval):
+    "Fast path of tabulate() for tables with declared column types."
+    cols = list(izip_longest(*list_of_lists))
+    ncols = len(cols)
+    if isinstance(coltypes, type):
+        coltypes = ncols * [coltypes]
+    else:
+        coltypes = list(coltypes) + max(0, ncols - len(coltypes)) * [_text_type]
+    float_formats = _expand_option(floatfmt, ncols, _DEFAULT_FLOATFMT)
+    missing_vals = _expand_option(missingval, ncols, _DEFAULT_MISSINGVAL)
+
+    aligns = [numalign if ct in [int, float] else stralign for ct in coltypes[:ncols]]
+    minwidths = [len(h) + MIN_PADDING for h in headers] if headers else []
+    minwidths.extend(max(0, ncols - len(minwidths)) * [0])
+    colwidths = []
+    for i, col in enumerate(cols):
+        convert = _typed_converter(coltypes[i], float_formats[i])
+        miss = missing_vals[i]
+        cols[i] = [miss if v is None else convert(v) for v in col]
+        colwidths.append(max(max(map(len, cols[i])), minwidths[i]))
+
+    if headers:
+        t_aligns = aligns or [stralign] * len(headers)
+        if not cols:
+            colwidths = [len(h) + MIN_PADDING for h in headers]
+        headers = [_align_header(h, a, w, len(h)) for h, a, w in zip(headers, t_aligns, colwidths)]
+
+    if not isinstance(tablefmt, TableFormat):
+        tablefmt = _table_formats.get(tablefmt, _table_formats["simple"])
+
+    if headers or cols:
+        return "\n".join(_table_lines(tablefmt, headers, zip(*cols), colwidths, aligns, False,
+                                      _typed_row_builder(tablefmt, colwidths, aligns)))
+    else: # a completely empty table
+        return ""
+
+
+def _expand_option(option, column_count, default):
+    "A string applies to every column, a list is completed with the default."
+    if isinstance(option, basestring):
+        return column_count * [option]
+    values = list(option)
+    values.extend(max(0, column_count - len(values)) * [default])
+    return values
+
+
+def _typed_converter(coltype, floatfmt):
+    "Return a function formatting a non-missing cell of a declared type."
+    if coltype is float:
+        return lambda val: format(float(val), floatfmt)
+    elif PRESERVE_WHITESPACE:
+        return _text_type
+    else:
+        return lambda val: _text_type(val).strip()
+
+
+def _typed_row_builder(fmt, colwidths, colaligns):
+    """Return a function rendering the lines of a row of unpadded cells.
+
+    Plain (begin, sep, end) row formats are compiled to one format string
+    which pads and joins the cells in a single call.
+    """
+    pad = fmt.padding
+    rowfmt = fmt.datarow
+    if hasattr(rowfmt, "__call__"):
+        padfns = {"left": _padright, "center": _padboth, "right": _padleft, "decimal": _padleft}
+        padded_widths = [w + 2*pad for w in colwidths]
+        def build(row):
+            cells = [padfns.get(a, _padnone)(w, c) for c, w, a in zip(row, colwidths, colaligns)]
+            return [rowfmt(_pad_row(cells, pad), padded_widths, colaligns)]
+        return build
+    escape = lambda s: s.replace("{", "{{").replace("}", "}}")
+    specs = {"left": "<", "center": "^", "right": ">", "decimal": ">"}
+    begin, sep, end = rowfmt
+    cells = []
+    for i, (w, a) in enumerate(zip(colwidths, colaligns)):
+        field = "{%d:%s%d}" % (i, specs[a], w) if a in specs else "{%d}" % i
+        cells.append(" "*pad + field + " "*pad)
+    template = escape(begin) + escape(sep).join(cells) + escape(end)
+    return lambda row: [template.format(*row).rstrip()]
+
+
+def tabulate_lines(rows, headers=(), tablefmt="simple", floatfmt=_DEFAULT_FLOATFMT,
+                   numalign="decimal", stralign="left", missingval=_DEFAULT_MISSINGVAL,
+                   coltypes=None, colwidths=None):
+    """Like tabulate(), but yield the lines of the table one by one.
+
+    `rows` is an iterable of rows (lists or tuples) and `headers` a list
+    or "firstrow". Column types come from `coltypes` (see tabulate()) or
+    are inferred; column widths come from `colwidths` or from a first
+    pass over the rows, so only one row is formatted at a time.
+
+    Without `colwidths` the rows are iterated twice: lists and objects
+    whose __iter__ starts over (such as a seekable file reader) are read
+    twice, a one-shot iterator is copied into a list first. With
+    `colwidths` the rows are read once and may come from a generator of
+    any size; cells wider than their column are not truncated, columns
+    without a declared type are text and "decimal" alignment falls back
+    to right alignment. A row (or the headers) with more cells than
+    `colwidths` raises ValueError, shorter rows get missing values.
+    Multiline cells and ANSI codes are not handled.
+
+    >>> for line in tabulate_lines([["spam", 41.9999], ["eggs", "451.0"]]):
+    ...     print(line)
+    ----  --------
+    spam   41.9999
+    eggs  451
+    ----  --------
+
+    >>> list(tabulate_lines([["spam", 41.9999, "x"]], colwidths=[4, 7]))
+    Traceback (most recent call last):
+    ...
+    ValueError: row with 3 cells, but colwidths has 2
+    """
+    declared = colwidths is not None
+    if colwidths is None and iter(rows) is rows:
+        rows = list(rows)
+    elif colwidths is not None:
+        rows = iter(rows)
+    if tablefmt == 'rst':
+        each = lambda rows: (_rst_escape_first_column([row], ())[0][0] for row in rows)
+    else:
+        each = iter
+    skip = 0
+    if headers == "firstrow":
+        first = iter(rows)
+        headers = list(next(first, []))
+        skip = 0 if first is rows else 1
+    headers = list(map(_text_type, headers))
+
+    if colwidths is None:
+        coltypes, colwidths, decimals = _measure_rows(islice(each(rows), skip, None), coltypes,
+                                                      floatfmt, missingval, numalign == "decimal")
+    else:
+        colwidths = list(colwidths)
+        coltypes = [_declared_type(coltypes, i) for i in range(len(colwidths))]
+        decimals = len(colwidths) * [None]
+    aligns = [numalign if ct in [int, float] else stralign for ct in coltypes]
+    if headers and not colwidths:
+        # only headers: no column alignments, like tabulate()
+        colwidths = len(headers) * [0]
+        decimals = len(headers) * [None]
+        h_aligns = len(headers) * [stralign]
+    elif not colwidths: # a completely empty table
+        return
+    else:
+        h_aligns = aligns
+    ncols = len(colwidths)
+
+    if declared and len(headers) > ncols:
+        raise ValueError("headers with {0} cells, but colwidths has {1}".format(len(headers), ncols))
+    if headers:
+        headers = ([""] * (ncols - len(headers)) + headers)[:ncols]
+        if tablefmt == 'rst':
+            headers = _rst_escape_first_column([], headers)[1]
+        colwidths = [max(w, len(h) + MIN_PADDING) for w, h in zip(colwidths, headers)]
+        headers = [_align_header(h, a, w, len(h)) for h, a, w in zip(headers, h_aligns, colwidths)]
+
+    converters = [_typed_converter(_declared_type(coltypes, i), _column_option(floatfmt, i, _DEFAULT_FLOATFMT))
+                  for i in range(ncols)]
+    missing_vals = [_column_option(missingval, i, _DEFAULT_MISSINGVAL) for i in range(ncols)]
+    aligned = [i for i, d in enumerate(decimals) if d is not None]
+
+    def formatted(row):
+        if len(row) > ncols:
+            raise ValueError("row with {0} cells, but colwidths has {1}".format(len(row), ncols))
+        cells = [miss if v is None else convert(v)
+                 for v, convert, miss in zip(row, converters, missing_vals)]
+        cells.extend(missing_vals[len(cells):])
+        # decimal points are aligned with trailing spaces, as _align_column does
+        for i in aligned:
+            if i < len(row) and row[i] is not None:
+                cells[i] = cells[i] + (decimals[i] - _afterpoint(cells[i])) * " "
+        return cells
+
+    if not isinstance(tablefmt, TableFormat):
+        tablefmt = _table_formats.get(tablefmt, _table_formats["simple"])
+    datarows = (formatted(row) for row in islice(each(rows), skip, None))
+    for line in _table_lines(tablefmt, headers, datarows, colwidths, aligns, False,
+                             _typed_row_builder(tablefmt, colwidths, aligns)):
+        yield line
+
+
+def _declared_type(coltypes, index):
+    if coltypes is None:
+        return _text_type
+    elif isinstance(coltypes, type):
+        return coltypes
+    else:
+        return coltypes[index] if index < len(coltypes) else _text_type
+
+
+def _column_option(option, index, default):
+    if isinstance(option, basestring):
+        return option
+    else:
+        return option[index] if index < len(option) else default
+
+
+def _measure_rows(rows, coltypes, floatfmt, missingval, decimal):
+    """Read `rows` once and return the type and the width of each column,
+    and the most digits after the point of the decimal-aligned columns
+    (None for the other columns).
+
+    Without declared types, numeric cells are measured both as text and
+    as floats, since the column type is only known at the end.
+    """
+    types, textw, floatw, intpart, decimals, hasnone = [], [], [], [], [], []
+    for row in rows:
+        for i, val in enumerate(row):
+            if i == len(types):
+                types.append(_bool_type if coltypes is None else _declared_type(coltypes, i))
+                textw.append(0)
+                floatw.append(0)
+                intpart.append(0)
+                decimals.append(-1)
+                hasnone.append(False)
+            if val is None:
+                hasnone[i] = True
+                continue
+            if coltypes is None:
+                valtype = _type(val, False)
+                types[i] = _more_generic(types[i], valtype)
+                floatcell = valtype in [int, float]
+            else:
+                floatcell = types[i] is float
+            if floatcell:
+                cell = format(float(val), _column_option(floatfmt, i, _DEFAULT_FLOATFMT))
+                floatw[i] = max(floatw[i], len(cell))
+                if decimal:
+                    afterpoint = _afterpoint(cell)
+                    decimals[i] = max(decimals[i], afterpoint)
+                    intpart[i] = max(intpart[i], len(cell) - afterpoint)
+            if coltypes is None or not floatcell:
+                textw[i] = max(textw[i], len(_typed_converter(_text_type, None)(val)))
+
+    widths = []
+    for i, coltype in enumerate(types):
+        if coltype is float:
+            width = intpart[i] + decimals[i] if decimal else floatw[i]
+        else:
+            width = textw[i]
+        if hasnone[i]:
+            width = max(width, len(_column_option(missingval, i, _DEFAULT_MISSINGVAL)))
+        widths.append(width)
+    decimals = [d if decimal and t is float else None for d, t in zip(decimals, types)]
+    return types, widths, decimals
+
+
 def _expand_numparse(disable_numparse, column_count):
     """
     Return a list of bools of length `column_count` which indicates whether
@@ -1381,14 +1653,13 @@ def _build_line(colwidths, colaligns, linefmt):
         return _build_simple_row(cells, (begin, sep, end))
 
 
-def _append_line(lines, colwidths, colaligns, linefmt):
-    lines.append(_build_line(colwidths, colaligns, linefmt))
-    return lines
+def _table_lines(fmt, headers, rows, colwidths, colaligns, is_multiline, build_row=None):
+    """Yield the lines of the table one by one.
 
-
-def _format_table(fmt, headers, rows, colwidths, colaligns, is_multiline):
-    """Produce a plain-text representation of the table."""
-    lines = []
+    `rows` may be any iterable of aligned cells; `build_row` renders the
+    lines of one data row (by default the cells are padded and formatted
+    with `fmt.datarow`).
+    """
     hidden = fmt.with_header_hide if (headers and fmt.with_header_hide) else []
     pad = fmt.padding
     headerrow = fmt.headerrow
@@ -1400,34 +1671,38 @@ def _format_table(fmt, headers, rows, colwidths, colaligns, is_multiline):
     else:
         pad_row = _pad_row
         append_row = _append_basic_row
+    if build_row is None:
+        build_row = lambda row: append_row([], pad_row(row, pad), padded_widths, colaligns, fmt.datarow)
 
     padded_headers = pad_row(headers, pad)
-    padded_rows = [pad_row(row, pad) for row in rows]
 
     if fmt.lineabove and "lineabove" not in hidden:
-        _append_line(lines, padded_widths, colaligns, fmt.lineabove)
+        yield _build_line(padded_widths, colaligns, fmt.lineabove)
 
     if padded_headers:
-        append_row(lines, padded_headers, padded_widths, colaligns, headerrow)
+        for line in append_row([], padded_headers, padded_widths, colaligns, headerrow):
+            yield line
         if fmt.linebelowheader and "linebelowheader" not in hidden:
-            _append_line(lines, padded_widths, colaligns, fmt.linebelowheader)
-
-    if padded_rows and fmt.linebetweenrows and "linebetweenrows" not in hidden:
-        # initial rows with a line below
-        for row in padded_rows[:-1]:
-            append_row(lines, row, padded_widths, colaligns, fmt.datarow)
-            _append_line(lines, padded_widths, colaligns, fmt.linebetweenrows)
-        # the last row without a line below
-        append_row(lines, padded_rows[-1], padded_widths, colaligns, fmt.datarow)
-    else:
-        for row in padded_rows:
-            append_row(lines, row, padded_widths, colaligns, fmt.datarow)
+            yield _build_line(padded_widths, colaligns, fmt.linebelowheader)
+
+    # a line between rows, but not below the last one
+    between = fmt.linebetweenrows and "linebetweenrows" not in hidden
+    first = True
+    for row in rows:
+        if between and not first:
+            yield _build_line(padded_widths, colaligns, fmt.linebetweenrows)
+        first = False
+        for line in build_row(row):
+            yield line
 
     if fmt.linebelow and "linebelow" not in hidden:
-        _append_line(lines, padded_widths, colaligns, fmt.linebelow)
+        yield _build_line(padded_widths, colaligns, fmt.linebelow)
+
 
+def _format_table(fmt, headers, rows, colwidths, colaligns, is_multiline):
+    """Produce a plain-text representation of the table."""
     if headers or rows:
-        return "\n".join(lines)
+        return "\n".join(_table_lines(fmt, headers, rows, colwidths, colaligns, is_multiline))
     else: # a completely empty table
         return ""
 
@@ -1449,6 +1724,9 @@ def _main():
     -o FILE, --output FILE    print table to FILE (default: stdout)
     -s REGEXP, --sep REGEXP   use a custom column separator (default: whitespace)
     -F FPFMT, --float FPFMT   floating point number format (default: g)
+    -w W1,W2,..., --widths W1,W2,...
+                              column widths; the input is then read once,
+                              as text columns (default: measured first)
     -f FMT, --format FMT      set output table format; supported formats:
                               plain, simple, grid, fancy_grid, pipe, orgtbl,
                               rst, mediawiki, html, latex, latex_raw,
@@ -1461,8 +1739,8 @@ def _main():
     usage = textwrap.dedent(_main.__doc__)
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                     "h1o:s:F:f:",
-                     ["help", "header", "output", "sep=", "float=", "format="])
+                     "h1o:s:F:f:w:",
+                     ["help", "header", "output", "sep=", "float=", "format=", "widths="])
     except getopt.GetoptError as e:
         print(e)
         print(usage)
@@ -1472,6 +1750,7 @@ def _main():
     tablefmt = "simple"
     sep = r"\s+"
     outfile = "-"
+    colwidths = None
     for opt, value in opts:
         if opt in ["-1", "--header"]:
             headers = "firstrow"
@@ -1487,6 +1766,8 @@ def _main():
             tablefmt = value
         elif opt in ["-s", "--sep"]:
             sep = value
+        elif opt in ["-w", "--widths"]:
+            colwidths = [int(w) for w in value.split(",")]
         elif opt in ["-h", "--help"]:
             print(usage)
             sys.exit(0)
@@ -1497,17 +1778,43 @@ def _main():
                 f = sys.stdin
             if _is_file(f):
                 _pprint_file(f, headers=headers, tablefmt=tablefmt,
-                             sep=sep, floatfmt=floatfmt, file=out)
+                             sep=sep, floatfmt=floatfmt, file=out, colwidths=colwidths)
             else:
                 with open(f) as fobj:
                     _pprint_file(fobj, headers=headers, tablefmt=tablefmt,
-                                 sep=sep, floatfmt=floatfmt, file=out)
+                                 sep=sep, floatfmt=floatfmt, file=out, colwidths=colwidths)
 
 
-def _pprint_file(fobject, headers, tablefmt, sep, floatfmt, file):
-    rows = fobject.readlines()
-    table = [re.split(sep, r.rstrip()) for r in rows if r.strip()]
-    print(tabulate(table, headers, tablefmt, floatfmt=floatfmt), file=file)
+def _pprint_file(fobject, headers, tablefmt, sep, floatfmt, file, colwidths=None):
+    rows = _FileRows(fobject, sep)
+    if colwidths is None and not _is_seekable(fobject):
+        rows = list(rows) # a pipe can't be read twice
+    for line in tabulate_lines(rows, headers, tablefmt, floatfmt=floatfmt, colwidths=colwidths):
+        print(line, file=file)
+
+
+class _FileRows(object):
+    "The non-blank lines of a file split into cells, from the start of the file on every iteration."
+
+    def __init__(self, fobject, sep):
+        self._fobject = fobject
+        self._sep = sep
+        self._start = fobject.tell() if _is_seekable(fobject) else None
+
+    def __iter__(self):
+        if self._start is not None:
+            self._fobject.seek(self._start)
+        for r in self._fobject:
+            if r.strip():
+                yield re.split(self._sep, r.rstrip())
+
+
+def _is_seekable(f):
+    try:
+        f.seek(f.tell())
+        return True
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
 
 
 if __name__ == "__main__":
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import hardware
+from hardware import *
+from so import *
+
+## the clock never sleeps in the tests, the ticks are notified one after the other
+hardware.sleep = lambda seconds: None
+
+
+## setup of a new machine and kernel for every test (HARDWARE is global)
+class KernelTestCase(unittest.TestCase):
+
+    ## newScheduler is called after the setup (ej: RoundRobin sets the quantum of the new timer)
+    def newKernel(self, newScheduler = FirstComeFirstServed, memorySize = 32, **options):
+        HARDWARE.setup(memorySize, **options)
+        return Kernel(newScheduler())
+
+    ## notifies ticks until every pcb terminated (at most maxTicks), returns the ticks notified
+    def runUntilTerminated(self, kernel, maxTicks = 200):
+        tickNbr = 0
+        while (tickNbr < maxTicks) and not (len(kernel.pcbTable._pcbTable) > 0 and kernel.pcbTable.allTerminated()):
+            HARDWARE.clock.notify(tickNbr)
+            tickNbr += 1
+        return tickNbr
+
+
+class ProgramImageCacheTest(KernelTestCase):
+
+    def test_a_single_run_is_a_miss(self):
+        kernel = self.newKernel()
+        kernel.fileSystem.write("c:/prg.exe", Program("prg.exe", [ASM.CPU(5)]))
+        kernel.run("c:/prg.exe", 1)
+        self.assertEqual(kernel.loader.imageCache.misses, 1)
+        self.assertEqual(kernel.loader.imageCache.hits, 0)
+        self.assertEqual(kernel.loader.imageCache.hitRate, 0.0)
+
+    def test_running_the_program_again_is_a_hit(self):
+        kernel = self.newKernel()
+        kernel.fileSystem.write("c:/prg.exe", Program("prg.exe", [ASM.CPU(5)]))
+        kernel.run("c:/prg.exe", 1)
+        kernel.run("c:/prg.exe", 1)
+        self.assertEqual(kernel.loader.imageCache.hitRate, 0.5)
+
+
+## the deferred irqs may change when a pcb changes state, but every program must run whole:
+## the same pcbs terminate, each one at the end of its program, and every frame is freed
+class DeferredInterruptsTest(KernelTestCase):
+
+    ## programs: (name, instructions, priority, arrival tick), they share a Disk
+    def runPrograms(self, newScheduler, programs, deferredInterrupts):
+        kernel = self.newKernel(newScheduler, deferredInterrupts = deferredInterrupts)
+        HARDWARE.addIODevice(DiskIODevice())
+        for name, instructions, priority, arrival in programs:
+            kernel.fileSystem.write("c:/" + name, Program(name, instructions))
+        lastArrival = max([arrival for name, instructions, priority, arrival in programs])
+        tickNbr = 0
+        while (tickNbr < 200) and not (tickNbr > lastArrival and kernel.pcbTable.allTerminated()):
+            for name, instructions, priority, arrival in programs:
+                if arrival == tickNbr:
+                    kernel.run("c:/" + name, priority)
+            HARDWARE.clock.notify(tickNbr)
+            tickNbr += 1
+        pcbs = [(pcb.pid, pcb.state, pcb.pc) for pcb in kernel.pcbTable._pcbTable.values()]
+        return pcbs, kernel.memoryManager.freeFrameCount
+
+    def assertSameAsSync(self, newScheduler, programs):
+        sync = self.runPrograms(newScheduler, programs, False)
+        deferred = self.runPrograms(newScheduler, programs, True)
+        self.assertEqual(deferred, sync)
+        self.assertTrue(all(state == "terminated" for pid, state, pc in sync[0]))
+
+    ## the #IO_OUT of "a" and the #KILL of "b" are raised in the same tick
+    def test_the_kill_acts_on_the_pcb_that_raised_it(self):
+        programs = [("a", [ASM.IO(), ASM.CPU(3)], 1, 0), ("b", [ASM.CPU(3)], 3, 0)]
+        self.assertSameAsSync(PreemptivePriority, programs)
+
+    def test_round_robin_with_io(self):
+        programs = [("a", [ASM.CPU(2), ASM.IO(), ASM.CPU(3)], 1, 0), ("b", [ASM.CPU(5), ASM.IO()], 2, 0), ("c", [ASM.IO(), ASM.CPU(4)], 3, 0)]
+        self.assertSameAsSync(lambda: RoundRobin(2), programs)
+
+    ## an #IO_OUT and an #IO_IN for the Disk in the same tick: the new operation
+    ## must not take the channel before the finished one is handed back
+    def test_programs_arriving_while_others_use_the_disk(self):
+        programs = [("a", [ASM.IO("Disk", 53), ASM.CPU(3), ASM.IO("Disk", 38)], 2, 0),
+                    ("b", [ASM.IO("Disk", 27), ASM.IO("Disk", 36), ASM.CPU(1)], 3, 2),
+                    ("c", [ASM.IO(), ASM.IO("Disk", 90), ASM.IO()], 1, 4),
+                    ("d", [ASM.CPU(1), ASM.IO(), ASM.IO("Disk", 60)], 3, 6),
+                    ("e", [ASM.CPU(2), ASM.IO("Disk", 26)], 3, 8)]
+        self.assertSameAsSync(FirstComeFirstServed, programs)
+
+
+## keeps the dma transfers that finished
+class DmaListener():
+
+    def __init__(self):
+        self.transfers = []
+
+    def transferred(self, tag, data):
+        self.transfers.append((tag, data))
+
+
+class DmaTest(KernelTestCase):
+
+    def test_a_transfer_that_is_not_of_the_loader(self):
+        kernel = self.newKernel()
+        listener = DmaListener()
+        kernel.addDmaListener(listener)
+        HARDWARE.memory.putBlock(8, ["a", "b", "c"])
+        HARDWARE.dma.read(8, 3, "mine")
+        HARDWARE.dma.write(20, ["x"])
+        for tickNbr in range(3):
+            HARDWARE.clock.notify(tickNbr)
+        self.assertEqual(listener.transfers, [("mine", ["a", "b", "c"]), (None, ["x"])])
+        self.assertEqual(HARDWARE.memory.get(20), "x")
+
+    def test_nobody_waits_for_the_transfer(self):
+        kernel = self.newKernel()
+        HARDWARE.dma.read(0, 2)
+        for tickNbr in range(2):
+            HARDWARE.clock.notify(tickNbr)
+        self.assertTrue(HARDWARE.dma.is_idle)
+
+    def test_the_loader_still_loads_with_dma(self):
+        HARDWARE.setup(32)
+        kernel = Kernel(FirstComeFirstServed(), useDMA = True)
+        kernel.addDmaListener(DmaListener())
+        kernel.fileSystem.write("c:/prg.exe", Program("prg.exe", [ASM.CPU(6)]))
+        kernel.run("c:/prg.exe", 1)
+        self.runUntilTerminated(kernel)
+        self.assertTrue(kernel.pcbTable.allTerminated())
+        self.assertEqual(kernel.dmaListeners[0].transfers, [])
+
+
+class PriorityAdmissionTest(KernelTestCase):
+
+    ## a program without priority waits for memory after the ones with priority
+    def test_a_program_without_priority(self):
+        HARDWARE.setup(8)
+        kernel = Kernel(FirstComeFirstServed(), PriorityAdmission())
+        for name in ["a.exe", "b.exe", "c.exe"]:
+            kernel.fileSystem.write("c:/" + name, Program(name, [ASM.CPU(7)]))
+        ## a.exe takes the whole memory, the others wait
+        kernel.run("c:/a.exe", 1)
+        kernel.run("c:/b.exe", None)
+        kernel.run("c:/c.exe", 2)
+        self.assertEqual([entry[2].pid for entry in sorted(kernel.admissionQueue._heap)], [2, 1])
+
+
+class GanttExporterTest(KernelTestCase):
+
+    ## b.exe waits for memory in "new" until a.exe terminates
+    def test_the_time_in_new_is_exported(self):
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        kernel = self.newKernel(memorySize = 8)
+        exporter = GanttExporter(jsonPath = path)
+        kernel.addStateListener(exporter)
+        for name in ["a.exe", "b.exe"]:
+            kernel.fileSystem.write("c:/" + name, Program(name, [ASM.CPU(7)]))
+        kernel.run("c:/a.exe", 1)
+        kernel.run("c:/b.exe", 1)
+        self.runUntilTerminated(kernel)
+        exporter.close()
+        with open(path) as traceFile:
+            spans = [(event["ts"], event["name"]) for event in json.load(traceFile) if event["tid"] == 1 and event["ph"] == "X"]
+        self.assertEqual(spans[0], (0, "new"))
+
+
+class FileIODeviceTest(KernelTestCase):
+
+    def test_the_payload_is_written_whole(self):
+        path = os.path.join(tempfile.mkdtemp(), "device.log")
+        kernel = self.newKernel()
+        HARDWARE.addIODevice(FileIODevice("File", path))
+        kernel.fileSystem.write("c:/prg.exe", Program("prg.exe", [ASM.CPU(1), ASM.IO("File", "key: a:b"), ASM.CPU(1)]))
+        kernel.run("c:/prg.exe", 1)
+        self.runUntilTerminated(kernel)
+        HARDWARE.switchOff()
+        with open(path) as deviceFile:
+            self.assertTrue(deviceFile.read().rstrip("\n").endswith(" key: a:b"))
+
+
+class DiskTest(unittest.TestCase):
+
+    def test_without_a_track_the_operation_is_done_at_the_head(self):
+        disk = DiskIODevice()
+        disk.execute(ASM.IO("Disk", 30))
+        self.assertEqual(disk.positionOf(ASM.IO("Disk")), 30)
+        self.assertEqual(disk.positionOf("IO:Disk:"), 30)
+
+    def test_a_track_that_is_not_a_number_is_rejected(self):
+        disk = DiskIODevice()
+        disk.validate(ASM.IO("Disk", 30))
+        with self.assertRaises(Exception):
+            disk.validate(ASM.IO("Disk", "abc"))
+
+    ## turns around at the last request, never goes on to the edge
+    def test_look_serves_up_then_down(self):
+        scheduler = LookIoScheduler()
+        for position in [60, 40, 80, 10]:
+            scheduler.add(position, position, 50)
+        head = 50
+        served = []
+        while len(scheduler) > 0:
+            head = scheduler.next(head)
+            served.append(head)
+        self.assertEqual(served, [60, 80, 40, 10])
+
+
+class AsyncBackendTest(KernelTestCase):
+
+    ## the programs are run once the clock is already ticking
+    def test_programs_run_after_switch_on_are_awaited(self):
+        kernel = self.newKernel(asyncBackend=True)
+        HARDWARE.clock.tickTime = 0
+        kernel.fileSystem.write("c:/a.exe", Program("a.exe", [ASM.CPU(3), ASM.IO(), ASM.CPU(1)]))
+        kernel.fileSystem.write("c:/b.exe", Program("b.exe", [ASM.CPU(2)]))
+
+        async def runBoth():
+            HARDWARE.switchOn()
+            return await asyncio.gather(kernel.runAsync("c:/a.exe", 1), kernel.runAsync("c:/b.exe", 1))
+
+        pcbs = asyncio.run(runBoth())
+        self.assertEqual([pcb.state for pcb in pcbs], ["terminated", "terminated"])
+
+
+## runs a program in the middle of a tick (from a clock subscriber)
+class MidTickSyscall():
+
+    def __init__(self, kernel, tickNbr, path, priority):
+        self._kernel = kernel
+        self._tickNbr = tickNbr
+        self._path = path
+        self._priority = priority
+
+    def tick(self, tickNbr):
+        if (self._kernel != None) and (tickNbr == self._tickNbr):
+            self._kernel.run(self._path, self._priority)
+
+
+class RecorderTest(KernelTestCase):
+
+    ## records the programs run in the middle of tick 2 and replays them on a new machine
+    def recordAndReplay(self, priorities, **options):
+        path = os.path.join(tempfile.mkdtemp(), "run.rec")
+        kernel = self.newKernel(lambda: RoundRobin(2), **options)
+        HARDWARE.clock.addSubscriber(MidTickSyscall(kernel, 2, "c:/b.exe", priorities[1]))
+        recorder = Recorder(kernel, path)
+        kernel.fileSystem.write("c:/a.exe", Program("a.exe", [ASM.CPU(4), ASM.IO(), ASM.CPU(2)]))
+        kernel.fileSystem.write("c:/b.exe", Program("b.exe", [ASM.CPU(3)]))
+        kernel.run("c:/a.exe", priorities[0])
+        self.runUntilTerminated(kernel)
+        recorder.close()
+        replayKernel = self.newKernel(lambda: RoundRobin(2), **options)
+        ## the replay needs the same clock subscribers, this one does nothing
+        HARDWARE.clock.addSubscriber(MidTickSyscall(None, 2, "c:/b.exe", priorities[1]))
+        replayer = Replayer(replayKernel, path)
+        self.assertTrue(replayer.run(), replayer.divergence)
+        self.assertGreater(replayer.checkedEvents, 0)
+        return [pcb.priority for pcb in replayKernel.pcbTable._pcbTable.values()]
+
+    def test_a_syscall_in_the_middle_of_a_tick(self):
+        self.recordAndReplay([1, 2])
+
+    def test_a_syscall_in_the_middle_of_a_tick_with_deferred_interrupts(self):
+        self.recordAndReplay([1, 2], deferredInterrupts = True)
+
+    def test_negative_and_missing_priorities(self):
+        self.assertEqual(self.recordAndReplay([-3, None]), [-3, None])
+
+
+if __name__ == '__main__':
+    unittest.main()